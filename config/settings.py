@@ -3,6 +3,7 @@ Application configuration and settings management.
 """
 
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, List
 from pydantic import Field, computed_field
@@ -29,19 +30,19 @@ class DatabaseSettings(BaseSettings):
     )
     
     mongodb_max_pool_size: int = Field(
-        default=10,
+        default=50,
         alias="MONGODB_MAX_POOL_SIZE",
         description="MongoDB connection pool size"
     )
     
     mongodb_min_pool_size: int = Field(
-        default=1,
+        default=10,
         alias="MONGODB_MIN_POOL_SIZE",
         description="MongoDB minimum connection pool size"
     )
     
     mongodb_max_idle_time: int = Field(
-        default=30000,
+        default=300000,
         alias="MONGODB_MAX_IDLE_TIME",
         description="MongoDB max idle time in milliseconds"
     )
@@ -390,17 +391,13 @@ class Settings(BaseSettings):
         return 100 * 1024 * 1024  # 100MB
 
 
-# Global settings instance
-settings = Settings()
-
-
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    """Get global settings instance."""
-    return settings
+    """Get global settings instance, parsed on first use."""
+    return Settings()
 
 
 def reload_settings():
     """Reload settings from environment."""
-    global settings
-    settings = Settings()
-    return settings 
\ No newline at end of file
+    get_settings.cache_clear()
+    return get_settings()
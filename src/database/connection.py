@@ -9,6 +9,7 @@ from contextlib import asynccontextmanager
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError, OperationFailure
 from pymongo import ASCENDING, DESCENDING
+from pymongo import monitoring
 
 from config.settings import get_settings
 from .models import INDEXES
@@ -16,6 +17,47 @@ from .models import INDEXES
 logger = logging.getLogger(__name__)
 
 
+class _PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Tracks connection pool usage from pymongo's pool events."""
+    
+    def __init__(self):
+        self.size = 0
+        self.in_use = 0
+    
+    def connection_created(self, event):
+        self.size += 1
+    
+    def connection_closed(self, event):
+        self.size -= 1
+    
+    def connection_checked_out(self, event):
+        self.in_use += 1
+    
+    def connection_checked_in(self, event):
+        self.in_use -= 1
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        pass
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_check_out_started(self, event):
+        pass
+    
+    def connection_check_out_failed(self, event):
+        pass
+
+
 class DatabaseConnectionManager:
     """Manages MongoDB database connections with connection pooling and error handling."""
     
@@ -27,6 +69,7 @@ class DatabaseConnectionManager:
         self._is_connected = False
         self._connection_attempts = 0
         self._max_connection_attempts = 3
+        self._pool_listener = _PoolStatsListener()
         
     async def connect(self) -> bool:
         """Establish connection to MongoDB."""
@@ -47,7 +90,8 @@ class DatabaseConnectionManager:
                     connectTimeoutMS=10000,
                     socketTimeoutMS=30000,
                     retryWrites=True,
-                    retryReads=True
+                    retryReads=True,
+                    event_listeners=[self._pool_listener]
                 )
                 
                 # Test connection
@@ -239,6 +283,23 @@ class DatabaseConnectionManager:
                 await session.abort_transaction()
             raise
     
+    def get_pool_stats(self) -> Dict[str, int]:
+        """
+        Get connection pool usage.
+        
+        Returns:
+            Dict with open (size), idle (free) and checked out (in_use) connections
+        """
+        size = self._pool_listener.size
+        in_use = self._pool_listener.in_use
+        return {
+            "size": size,
+            "free": size - in_use,
+            "in_use": in_use,
+            "max_size": self.settings.database.mongodb_max_pool_size,
+            "min_size": self.settings.database.mongodb_min_pool_size
+        }
+    
     async def get_database_info(self) -> Dict[str, Any]:
         """Get database information and statistics."""
         try:
@@ -306,6 +367,11 @@ async def get_collection(collection_name: str):
     return await db_manager.get_collection(collection_name)
 
 
+def get_pool_stats() -> Dict[str, int]:
+    """Get connection pool usage of the global database manager."""
+    return db_manager.get_pool_stats()
+
+
 async def close_database():
     """Close the database connection."""
     await db_manager.disconnect()
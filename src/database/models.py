@@ -342,7 +342,12 @@ INDEXES = {
         [("sender_id", 1)],
         [("created_at", -1)],
         [("instagram_timestamp", -1)],
-        [("status", 1)]
+        [("status", 1)],
+        # Full-text index backing $text search. The trailing thread_id key
+        # is only stored alongside each entry; it does not narrow the text
+        # scan, which would need thread_id as an equality prefix and make
+        # every search thread-scoped
+        [[("content", "text"), ("thread_id", 1)]]
     ],
     "chat_sessions": [
         [("telegram_user_id", 1)],
@@ -360,5 +365,8 @@ INDEXES = {
     "user_preferences": [
         [("telegram_user_id", 1), {"unique": True}],
         [("instagram_user_id", 1)]
+    ],
+    "bot_users": [
+        [("telegram_user_id", 1), {"unique": True}]
     ]
 } 
\ No newline at end of file
@@ -2,10 +2,13 @@
 Database operations for Instagram chat data.
 """
 
+import asyncio
 import logging
 from datetime import datetime, timezone
 from typing import List, Optional, Dict, Any
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from .connection import get_mongodb_manager
 from .models import (
@@ -35,6 +38,52 @@ async def _get_collection_safe(collection_name: str):
         return None
 
 
+async def _insert_many(collection_name: str, key: str, models: List[Any]) -> int:
+    """
+    Insert models that are not stored yet with a single unordered bulk_write.
+    
+    Each model becomes an upsert on its key field with $setOnInsert, so
+    documents already stored under that key are left untouched and the
+    rest are inserted. This does not rely on a unique index on the key.
+    
+    Args:
+        collection_name: Target collection
+        key: Field identifying a document (e.g. message_id)
+        models: Pydantic models to insert
+        
+    Returns:
+        int: Number of documents inserted
+    """
+    if not models:
+        return 0
+    
+    try:
+        collection = await _get_collection_safe(collection_name)
+        if collection is None:
+            return 0
+        
+        requests = []
+        for model in models:
+            document = model.dict(by_alias=True)
+            requests.append(
+                UpdateOne({key: document[key]}, {"$setOnInsert": document}, upsert=True)
+            )
+        
+        result = await collection.bulk_write(requests, ordered=False)
+        return result.upserted_count
+        
+    except BulkWriteError as e:
+        # Concurrent upserts of the same key may collide on a unique index;
+        # the document is stored either way
+        errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+        if errors:
+            logger.error(f"Error inserting into {collection_name}: {errors[0].get('errmsg')}")
+        return e.details.get("nUpserted", 0)
+    except Exception as e:
+        logger.error(f"Error inserting {len(models)} documents into {collection_name}: {e}")
+        return 0
+
+
 class InstagramUserOperations:
     """Operations for Instagram users."""
     
@@ -143,6 +192,37 @@ class InstagramUserOperations:
         except Exception as e:
             logger.error(f"Error getting user by username {username}: {e}")
             return None
+    
+    @staticmethod
+    async def get_users_by_instagram_ids(instagram_user_ids: List[str]) -> Dict[str, InstagramUser]:
+        """
+        Get several users by Instagram user ID in a single query.
+        
+        Args:
+            instagram_user_ids: Instagram user IDs
+            
+        Returns:
+            Dict[str, InstagramUser]: Users keyed by Instagram user ID
+        """
+        try:
+            if not instagram_user_ids:
+                return {}
+            
+            collection = await _get_collection_safe("instagram_users")
+            if collection is None:
+                return {}
+            
+            cursor = collection.find({"instagram_id": {"$in": list(instagram_user_ids)}})
+            
+            users = {}
+            async for user_data in cursor:
+                users[user_data["instagram_id"]] = InstagramUser(**user_data)
+            
+            return users
+            
+        except Exception as e:
+            logger.error(f"Error getting users {instagram_user_ids}: {e}")
+            return {}
 
 
 class InstagramMessageOperations:
@@ -189,7 +269,8 @@ class InstagramMessageOperations:
     async def get_messages_by_thread(
         thread_id: str, 
         limit: int = 50, 
-        offset: int = 0
+        offset: int = 0,
+        newest_first: bool = False
     ) -> List[InstagramMessage]:
         """
         Get messages from a specific thread.
@@ -198,6 +279,7 @@ class InstagramMessageOperations:
             thread_id: Thread ID
             limit: Maximum number of messages to return
             offset: Number of messages to skip
+            newest_first: Return messages newest first instead of chronologically
             
         Returns:
             List[InstagramMessage]: List of messages
@@ -216,8 +298,9 @@ class InstagramMessageOperations:
             async for message_data in cursor:
                 messages.append(InstagramMessage(**message_data))
             
-            # Return in chronological order (oldest first)
-            messages.reverse()
+            # Return in chronological order (oldest first) unless asked otherwise
+            if not newest_first:
+                messages.reverse()
             return messages
             
         except Exception as e:
@@ -399,6 +482,30 @@ class InstagramMessageOperations:
         except Exception as e:
             logger.error(f"Error getting messages since {since}: {e}")
             return []
+    
+    @staticmethod
+    async def count_messages_since(since: datetime, limit: Optional[int] = None) -> int:
+        """
+        Count messages created since a specific time.
+        
+        Args:
+            since: Start time
+            limit: Stop counting after this many messages
+            
+        Returns:
+            int: Number of messages
+        """
+        try:
+            collection = await _get_collection_safe("instagram_messages")
+            if collection is None:
+                return 0
+            
+            options = {"limit": limit} if limit else {}
+            return await collection.count_documents({"created_at": {"$gte": since}}, **options)
+            
+        except Exception as e:
+            logger.error(f"Error counting messages since {since}: {e}")
+            return 0
 
 
 class InstagramThreadOperations:
@@ -482,6 +589,37 @@ class InstagramThreadOperations:
             logger.error(f"Error getting thread {thread_id}: {e}")
             return None
     
+    @staticmethod
+    async def get_threads_by_ids(thread_ids: List[str]) -> Dict[str, InstagramThread]:
+        """
+        Get several threads by ID in a single query.
+        
+        Args:
+            thread_ids: Thread IDs
+            
+        Returns:
+            Dict[str, InstagramThread]: Threads keyed by thread ID
+        """
+        try:
+            if not thread_ids:
+                return {}
+            
+            collection = await _get_collection_safe("instagram_threads")
+            if collection is None:
+                return {}
+            
+            cursor = collection.find({"thread_id": {"$in": list(thread_ids)}})
+            
+            threads = {}
+            async for thread_data in cursor:
+                threads[thread_data["thread_id"]] = InstagramThread(**thread_data)
+            
+            return threads
+            
+        except Exception as e:
+            logger.error(f"Error getting threads {thread_ids}: {e}")
+            return {}
+    
     @staticmethod
     async def get_all_threads(limit: int = 100) -> List[InstagramThread]:
         """
@@ -746,6 +884,154 @@ class SyncStatusOperations:
             return None
 
 
+class BotUserOperations:
+    """Operations for registered Telegram bot users."""
+    
+    @staticmethod
+    async def bulk_upsert_users(users: List[Dict[str, Any]]) -> int:
+        """
+        Insert or replace bot users in one batch.
+        
+        Args:
+            users: User documents, each with a telegram_user_id
+            
+        Returns:
+            int: Number of documents matched or inserted (len(users) on success)
+        """
+        if not users:
+            return 0
+        
+        try:
+            collection = await _get_collection_safe("bot_users")
+            if collection is None:
+                return 0
+            
+            result = await collection.bulk_write(
+                [
+                    UpdateOne({"telegram_user_id": user["telegram_user_id"]}, {"$set": user}, upsert=True)
+                    for user in users
+                ],
+                ordered=False
+            )
+            return result.matched_count + result.upserted_count
+            
+        except Exception as e:
+            logger.error(f"Error upserting {len(users)} bot users: {e}")
+            return 0
+    
+    @staticmethod
+    async def bulk_insert_users(users: List[Dict[str, Any]]) -> Optional[List[int]]:
+        """
+        Insert bot users that are not stored yet in one batch.
+        
+        Users already stored under the same telegram_user_id are left
+        untouched.
+        
+        Args:
+            users: User documents, each with a telegram_user_id
+            
+        Returns:
+            List[int]: IDs of the users actually inserted, or None on error
+        """
+        if not users:
+            return []
+        
+        try:
+            collection = await _get_collection_safe("bot_users")
+            if collection is None:
+                return None
+            
+            result = await collection.bulk_write(
+                [
+                    UpdateOne({"telegram_user_id": user["telegram_user_id"]}, {"$setOnInsert": user}, upsert=True)
+                    for user in users
+                ],
+                ordered=False
+            )
+            return [users[index]["telegram_user_id"] for index in result.upserted_ids]
+            
+        except Exception as e:
+            logger.error(f"Error inserting {len(users)} bot users: {e}")
+            return None
+    
+    @staticmethod
+    async def get_user(telegram_user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a bot user by Telegram user ID.
+        
+        Args:
+            telegram_user_id: Telegram user ID
+            
+        Returns:
+            Dict: User document without _id, or None if not found
+        """
+        try:
+            collection = await _get_collection_safe("bot_users")
+            if collection is None:
+                return None
+            
+            return await collection.find_one({"telegram_user_id": telegram_user_id}, {"_id": 0})
+            
+        except Exception as e:
+            logger.error(f"Error getting bot user {telegram_user_id}: {e}")
+            return None
+    
+    @staticmethod
+    async def find_user_ids(telegram_user_ids: List[int]) -> Optional[List[int]]:
+        """
+        Find which of the given bot users are stored.
+        
+        Args:
+            telegram_user_ids: Telegram user IDs to look up
+            
+        Returns:
+            List[int]: IDs that have a document, or None if the lookup failed
+        """
+        if not telegram_user_ids:
+            return []
+        
+        try:
+            collection = await _get_collection_safe("bot_users")
+            if collection is None:
+                return None
+            
+            cursor = collection.find(
+                {"telegram_user_id": {"$in": telegram_user_ids}},
+                {"_id": 0, "telegram_user_id": 1}
+            )
+            return [document["telegram_user_id"] async for document in cursor]
+            
+        except Exception as e:
+            logger.error(f"Error finding {len(telegram_user_ids)} bot users: {e}")
+            return None
+    
+    @staticmethod
+    async def delete_users(telegram_user_ids: List[int]) -> int:
+        """
+        Delete bot users.
+        
+        Args:
+            telegram_user_ids: Telegram user IDs to delete
+            
+        Returns:
+            int: Number of documents deleted
+        """
+        if not telegram_user_ids:
+            return 0
+        
+        try:
+            collection = await _get_collection_safe("bot_users")
+            if collection is None:
+                return 0
+            
+            result = await collection.delete_many({"telegram_user_id": {"$in": telegram_user_ids}})
+            return result.deleted_count
+            
+        except Exception as e:
+            logger.error(f"Error deleting {len(telegram_user_ids)} bot users: {e}")
+            return 0
+
+
 class InstagramOperations:
     """Main Instagram operations class."""
     
@@ -755,6 +1041,7 @@ class InstagramOperations:
         self.thread_ops = InstagramThreadOperations()
         self.session_ops = ChatSessionOperations()
         self.sync_ops = SyncStatusOperations()
+        self.bot_user_ops = BotUserOperations()
     
     async def test_connection(self) -> bool:
         """Test database connection."""
@@ -784,6 +1071,51 @@ class InstagramOperations:
         """Get user by Instagram username."""
         return await self.user_ops.get_user_by_username(username)
     
+    async def get_users_by_ids(self, user_ids) -> Dict[str, Dict[str, Any]]:
+        """Get users by Instagram user ID, keyed by ID."""
+        try:
+            users = await self.user_ops.get_users_by_instagram_ids([uid for uid in user_ids if uid])
+            
+            # Convert to dict format
+            user_dicts = {}
+            for user_id, user in users.items():
+                user_dict = user.dict(by_alias=True)
+                user_dict['_id'] = str(user_dict['_id'])
+                user_dicts[user_id] = user_dict
+            
+            return user_dicts
+        except Exception as e:
+            logger.error(f"Error getting users by IDs: {e}")
+            return {}
+    
+    async def create_many(
+        self,
+        users: Optional[List[InstagramUser]] = None,
+        threads: Optional[List[InstagramThread]] = None,
+        messages: Optional[List[InstagramMessage]] = None
+    ) -> Dict[str, int]:
+        """
+        Insert users, threads and messages with one bulk_write per collection.
+        
+        Documents are matched on instagram_id, thread_id and message_id.
+        Unlike create_user/create_thread, existing documents are skipped
+        rather than updated.
+        
+        Args:
+            users: Users to insert
+            threads: Threads to insert
+            messages: Messages to insert
+            
+        Returns:
+            Dict with the number of inserted users, threads and messages
+        """
+        users_count, threads_count, messages_count = await asyncio.gather(
+            _insert_many("instagram_users", "instagram_id", users or []),
+            _insert_many("instagram_threads", "thread_id", threads or []),
+            _insert_many("instagram_messages", "message_id", messages or [])
+        )
+        return {"users": users_count, "threads": threads_count, "messages": messages_count}
+    
     # Message operations
     async def create_message(self, message_data: InstagramMessage) -> Optional[str]:
         """Create a new message."""
@@ -803,10 +1135,12 @@ class InstagramOperations:
             logger.error(f"Error updating message: {e}")
             return False
     
-    async def get_thread_messages(self, thread_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get messages from a specific thread."""
+    async def get_thread_messages(self, thread_id: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Get messages from a specific thread, newest first."""
         try:
-            messages = await self.message_ops.get_messages_by_thread(thread_id, limit)
+            messages = await self.message_ops.get_messages_by_thread(
+                thread_id, limit, offset, newest_first=True
+            )
             
             # Convert to dict format
             message_dicts = []
@@ -820,10 +1154,15 @@ class InstagramOperations:
             logger.error(f"Error getting thread messages: {e}")
             return []
     
-    async def search_messages(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
-        """Search messages by text content."""
+    async def search_messages(
+        self, 
+        query: str, 
+        limit: int = 20, 
+        thread_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Search messages by text content using the messages text index."""
         try:
-            messages = await self.message_ops.search_messages(query, limit=limit)
+            messages = await self.message_ops.search_messages(query, thread_id=thread_id, limit=limit)
             
             # Convert to dict format
             message_dicts = []
@@ -854,6 +1193,10 @@ class InstagramOperations:
             logger.error(f"Error getting messages since {since}: {e}")
             return []
     
+    async def count_messages_since(self, since: datetime, limit: Optional[int] = None) -> int:
+        """Count messages created since a specific time."""
+        return await self.message_ops.count_messages_since(since, limit)
+    
     # Thread operations
     async def create_thread(self, thread_data: Dict[str, Any]) -> Optional[str]:
         """Create a new Instagram thread."""
@@ -878,6 +1221,23 @@ class InstagramOperations:
             logger.error(f"Error getting thread: {e}")
             return None
     
+    async def get_threads_by_ids(self, thread_ids) -> Dict[str, Dict[str, Any]]:
+        """Get threads by ID, keyed by ID."""
+        try:
+            threads = await self.thread_ops.get_threads_by_ids([tid for tid in thread_ids if tid])
+            
+            # Convert to dict format
+            thread_dicts = {}
+            for thread_id, thread in threads.items():
+                thread_dict = thread.dict(by_alias=True)
+                thread_dict['_id'] = str(thread_dict['_id'])
+                thread_dicts[thread_id] = thread_dict
+            
+            return thread_dicts
+        except Exception as e:
+            logger.error(f"Error getting threads by IDs: {e}")
+            return {}
+    
     async def update_thread(self, thread_data: Dict[str, Any]) -> bool:
         """Update an existing thread."""
         try:
@@ -928,6 +1288,27 @@ class InstagramOperations:
             logger.error(f"Error getting message count: {e}")
             return 0
     
+    # Bot user operations
+    async def bulk_upsert_bot_users(self, users: List[Dict[str, Any]]) -> int:
+        """Insert or replace bot users in one batch."""
+        return await self.bot_user_ops.bulk_upsert_users(users)
+    
+    async def bulk_insert_bot_users(self, users: List[Dict[str, Any]]) -> Optional[List[int]]:
+        """Insert bot users that are not stored yet in one batch."""
+        return await self.bot_user_ops.bulk_insert_users(users)
+    
+    async def get_bot_user(self, telegram_user_id: int) -> Optional[Dict[str, Any]]:
+        """Get a bot user by Telegram user ID."""
+        return await self.bot_user_ops.get_user(telegram_user_id)
+    
+    async def find_bot_user_ids(self, telegram_user_ids: List[int]) -> Optional[List[int]]:
+        """Find which of the given bot users are stored."""
+        return await self.bot_user_ops.find_user_ids(telegram_user_ids)
+    
+    async def delete_bot_users(self, telegram_user_ids: List[int]) -> int:
+        """Delete bot users by Telegram user ID."""
+        return await self.bot_user_ops.delete_users(telegram_user_ids)
+    
     async def get_last_sync_time(self) -> Optional[datetime]:
         """Get the last sync time."""
         try:
@@ -4,7 +4,9 @@ Handles authentication, direct messages, and data synchronization.
 """
 
 import asyncio
+import json
 import logging
+import time
 from typing import List, Dict, Any, Optional, Generator
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -25,6 +27,9 @@ class InstagramClient:
     Handles authentication, rate limiting, and data fetching.
     """
     
+    # Sessions validated less than this long ago are reused without re-validation
+    SESSION_MAX_AGE = timedelta(hours=6)
+    
     def __init__(self, username: str, password: str, session_file: str = "instagram_session.json"):
         """
         Initialize Instagram client.
@@ -39,10 +44,19 @@ class InstagramClient:
         self.session_file = Path(session_file)
         self.client = Client()
         self.is_authenticated = False
+        # Epoch seconds the session was last validated, stored in the session file
+        self._session_validated_at: Optional[float] = None
         
         # Configure client settings
         self._configure_client()
     
+    def _save_session(self):
+        """Write the session settings, stamped with when it was last validated."""
+        settings = self.client.get_settings()
+        settings["saved_at"] = self._session_validated_at
+        with open(self.session_file, "w") as fp:
+            json.dump(settings, fp, indent=4)
+    
     def _configure_client(self):
         """Configure instagrapi client settings."""
         # Use minimal configuration to avoid detection
@@ -94,10 +108,26 @@ class InstagramClient:
             if self.session_file.exists():
                 logger.info("Loading existing session...")
                 try:
-                    self.client.load_settings(str(self.session_file))
+                    with open(self.session_file) as fp:
+                        settings = json.load(fp)
+                    self.client.set_settings(settings)
+                    
+                    # Sessions validated recently are trusted as is; older or
+                    # unstamped ones (e.g. a checked-in file) are checked with a
+                    # feed request before being reused. The file's mtime is not
+                    # used since a checkout or deploy resets it
+                    saved_at = settings.get("saved_at")
+                    if saved_at is not None:
+                        session_age = datetime.now() - datetime.fromtimestamp(saved_at)
+                        if session_age < self.SESSION_MAX_AGE:
+                            self._session_validated_at = saved_at
+                            self.is_authenticated = True
+                            logger.info(f"Reusing session validated {int(session_age.total_seconds() // 60)} minutes ago")
+                            return True
                     
-                    # Test if session is still valid
                     await asyncio.to_thread(self.client.get_timeline_feed)
+                    self._session_validated_at = time.time()
+                    await asyncio.to_thread(self._save_session)
                     self.is_authenticated = True
                     logger.info("Session loaded successfully")
                     return True
@@ -122,10 +152,8 @@ class InstagramClient:
                     logger.info(f"✅ Authentication successful! Logged in as: {account_info.username}")
                     
                     # Save session for future use
-                    await asyncio.to_thread(
-                        self.client.dump_settings, 
-                        str(self.session_file)
-                    )
+                    self._session_validated_at = time.time()
+                    await asyncio.to_thread(self._save_session)
                     
                     self.is_authenticated = True
                     return True
@@ -464,12 +492,9 @@ class InstagramClient:
     async def close(self):
         """Close the Instagram client."""
         try:
-            # Save session before closing
+            # Save session before closing, keeping its last validation time
             if self.is_authenticated and self.session_file:
-                await asyncio.to_thread(
-                    self.client.dump_settings, 
-                    str(self.session_file)
-                )
+                await asyncio.to_thread(self._save_session)
             
             logger.info("Instagram client closed")
             
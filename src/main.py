@@ -3,7 +3,10 @@ Main application entry point for Instagram-Telegram chat integration.
 """
 
 import asyncio
+import atexit
 import logging
+import logging.handlers
+import queue
 import signal
 import sys
 from pathlib import Path
@@ -23,13 +26,19 @@ from services.media_handler import get_media_handler
 from telegram_bot.bot import setup_telegram_handlers
 from telegram_bot.session import TelegramSessionManager
 
-# Configure logging
+# Configure logging; file writes go through a queue to a background thread
+# so they never block the event loop
+_log_queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.FileHandler('logs/app.log'))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout),
-        logging.FileHandler('logs/app.log')
+        logging.handlers.QueueHandler(_log_queue)
     ]
 )
 
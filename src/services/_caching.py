@@ -0,0 +1,58 @@
+"""
+Short-TTL memoization for service health and statistics probes.
+"""
+
+import functools
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+# Seconds that service health and stats probe results are reused
+PROBE_CACHE_TTL = 1.0
+
+# Probe statuses reporting a failure
+_FAILED_STATUSES = frozenset({"unhealthy", "error"})
+
+
+def _is_failure(result: Any) -> bool:
+    """Check whether a probe result reports an error or an unhealthy service."""
+    return isinstance(result, dict) and (
+        "error" in result or result.get("status") in _FAILED_STATUSES
+    )
+
+
+def ttl_cache(ttl: float) -> Callable:
+    """
+    Cache an async method's result per instance for a few seconds.
+    
+    Repeated probes within the TTL (e.g. /health followed by /status, or a
+    health check that also collects stats) reuse the last result instead
+    of hitting Redis or the filesystem again. Error and unhealthy results
+    are not cached, so a recovered service is reported as soon as it is back.
+    
+    Args:
+        ttl: Result lifetime in seconds
+    
+    Returns:
+        Decorator for async methods with hashable arguments
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            cache: Dict[Hashable, Tuple[float, Any]] = self.__dict__.setdefault("_ttl_cache", {})
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            
+            entry = cache.get(key)
+            if entry is not None and now - entry[0] < ttl:
+                return entry[1]
+            
+            result = await func(self, *args, **kwargs)
+            if _is_failure(result):
+                cache.pop(key, None)
+            else:
+                cache[key] = (now, result)
+            return result
+        
+        return wrapper
+    
+    return decorator
@@ -5,13 +5,14 @@ Handles image/video processing, storage management, and media caching.
 
 import asyncio
 import hashlib
+import io
 import logging
 import mimetypes
 import os
 import shutil
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 import uuid
 
@@ -20,6 +21,8 @@ import magic
 from pydantic import BaseModel, Field
 from enum import Enum
 
+from ._caching import PROBE_CACHE_TTL, ttl_cache
+
 logger = logging.getLogger(__name__)
 
 
@@ -138,63 +141,140 @@ class MediaHandler:
         try:
             file_path = Path(file_path)
             
-            if not file_path.exists():
+            # Check file size; a missing file shows up as the stat failing
+            try:
+                file_size = file_path.stat().st_size
+            except FileNotFoundError:
                 logger.error(f"File not found: {file_path}")
                 return None
             
-            # Check file size
-            file_size = file_path.stat().st_size
             if file_size > self.max_file_size:
                 logger.warning(f"File too large: {file_path} ({file_size} bytes)")
                 return None
             
-            # Detect media type and format
-            detected_info = await self._detect_media_info(file_path, original_filename)
-            
-            if not detected_info:
+            # Detect media type, format and metadata
+            file_hash = await self._generate_file_hash(file_path)
+            media_info = await self._detect_media_info(
+                file_path, original_filename, file_size, file_hash, media_type
+            )
+            if not media_info:
                 logger.error(f"Failed to detect media info for: {file_path}")
                 return None
             
-            # Override media type if specified
-            if media_type:
-                detected_info.media_type = media_type
+            return await self._store_processed_media(
+                media_info, lambda target_path: shutil.copy2(file_path, target_path)
+            )
             
-            # Generate file hash
-            file_hash = await self._generate_file_hash(file_path)
-            detected_info.hash = file_hash
-            
-            # Check if file already exists (deduplication)
-            existing_file = await self._find_existing_file(file_hash, detected_info.media_type, detected_info.format)
-            if existing_file:
-                logger.info(f"File already exists: {existing_file}")
-                return await self._get_media_info(existing_file)
-            
-            # Store the file
-            stored_path = await self._store_media_file(file_path, detected_info)
-            if not stored_path:
-                logger.error(f"Failed to store media file: {file_path}")
-                return None
+        except Exception as e:
+            logger.error(f"Error processing media file {file_path}: {e}")
+            self.stats["errors"] += 1
+            return None
+    
+    async def process_media_bytes(
+        self,
+        data: bytes,
+        original_filename: str,
+        media_type: Optional[MediaType] = None
+    ) -> Optional[MediaInfo]:
+        """
+        Process in-memory media content and store it in the cache.
+        
+        Detection and hashing work on the buffer, so the content is only
+        written once, directly to its cache location.
+        
+        Args:
+            data: Media file content
+            original_filename: Original filename
+            media_type: Optional media type override
             
-            # Update file path
-            detected_info.metadata["stored_path"] = str(stored_path)
+        Returns:
+            MediaInfo: Media information if successful, None otherwise
+        """
+        try:
+            # Check file size
+            if len(data) > self.max_file_size:
+                logger.warning(f"File too large: {original_filename} ({len(data)} bytes)")
+                return None
             
-            # Update statistics
-            self.stats["files_processed"] += 1
-            self.stats["files_stored"] += 1
+            # Detect media type, format and metadata
+            media_info = await self._detect_media_info(
+                data, original_filename, len(data), hashlib.sha256(data).hexdigest(), media_type
+            )
+            if not media_info:
+                logger.error(f"Failed to detect media info for: {original_filename}")
+                return None
             
-            logger.info(f"Media file processed and stored: {stored_path}")
-            return detected_info
+            return await self._store_processed_media(media_info, lambda target_path: target_path.write_bytes(data))
             
         except Exception as e:
-            logger.error(f"Error processing media file {file_path}: {e}")
+            logger.error(f"Error processing media content {original_filename}: {e}")
             self.stats["errors"] += 1
             return None
     
-    async def _detect_media_info(self, file_path: Path, original_filename: str) -> Optional[MediaInfo]:
-        """Detect media file information."""
+    async def _store_processed_media(
+        self,
+        media_info: MediaInfo,
+        write: Callable[[Path], Any]
+    ) -> Optional[MediaInfo]:
+        """
+        Deduplicate and store processed media, shared by files and in-memory content.
+        
+        Args:
+            media_info: Detected media information, including the hash
+            write: Writes the content to the given target path
+            
+        Returns:
+            MediaInfo: Stored (or already existing) media information, None on failure
+        """
+        # Check if file already exists (deduplication)
+        existing_file = await self._find_existing_file(media_info.hash, media_info.media_type, media_info.format)
+        if existing_file:
+            logger.info(f"File already exists: {existing_file}")
+            return await self._get_media_info(existing_file)
+        
+        # Store the content
+        stored_path = await self._store_media_file(write, media_info)
+        if not stored_path:
+            logger.error(f"Failed to store media file: {media_info.original_filename}")
+            return None
+        
+        # Update file path
+        media_info.metadata["stored_path"] = str(stored_path)
+        
+        # Update statistics
+        self.stats["files_processed"] += 1
+        self.stats["files_stored"] += 1
+        
+        logger.info(f"Media processed and stored: {stored_path}")
+        return media_info
+    
+    async def _detect_media_info(
+        self,
+        source: Union[Path, bytes],
+        original_filename: str,
+        file_size: int,
+        file_hash: str,
+        media_type_override: Optional[MediaType] = None
+    ) -> Optional[MediaInfo]:
+        """
+        Detect media information from a file or in-memory content.
+        
+        Args:
+            source: Path to the media file, or its content
+            original_filename: Original filename
+            file_size: Size of the content in bytes
+            file_hash: SHA-256 of the content
+            media_type_override: Media type to report instead of the detected one
+            
+        Returns:
+            MediaInfo: Media information, or None if unsupported
+        """
         try:
             # Get MIME type
-            mime_type = self.mime_detector.from_file(str(file_path))
+            if isinstance(source, bytes):
+                mime_type = self.mime_detector.from_buffer(source)
+            else:
+                mime_type = self.mime_detector.from_file(str(source))
             
             # Determine media type and format
             media_type, format_type = self._classify_media(mime_type, original_filename)
@@ -203,28 +283,26 @@ class MediaHandler:
                 logger.warning(f"Unsupported media type: {mime_type}")
                 return None
             
-            # Get file size
-            file_size = file_path.stat().st_size
-            
             # Get dimensions and duration for supported types
             dimensions = None
             duration = None
             
             if media_type == MediaType.IMAGE:
-                dimensions = await self._get_image_dimensions(file_path)
+                dimensions = await self._get_image_dimensions(source)
             elif media_type in [MediaType.VIDEO, MediaType.AUDIO]:
-                duration = await self._get_media_duration(file_path)
+                duration = await self._get_media_duration(source)
                 if media_type == MediaType.VIDEO:
-                    dimensions = await self._get_video_dimensions(file_path)
+                    dimensions = await self._get_video_dimensions(source)
             
             return MediaInfo(
                 original_filename=original_filename,
-                media_type=media_type,
+                media_type=media_type_override or media_type,
                 format=format_type,
                 mime_type=mime_type,
                 file_size=file_size,
                 dimensions=dimensions,
-                duration=duration
+                duration=duration,
+                hash=file_hash
             )
             
         except Exception as e:
@@ -341,8 +419,8 @@ class MediaHandler:
             logger.error(f"Error finding existing file: {e}")
             return None
     
-    async def _store_media_file(self, source_path: Path, media_info: MediaInfo) -> Optional[Path]:
-        """Store the media file in the appropriate directory."""
+    async def _store_media_file(self, write: Callable[[Path], Any], media_info: MediaInfo) -> Optional[Path]:
+        """Store media content in the appropriate directory through a writer callback."""
         try:
             # Determine target directory
             target_dir = self.base_path / media_info.media_type.value / media_info.format.value
@@ -351,12 +429,12 @@ class MediaHandler:
             target_filename = f"{media_info.hash}.{media_info.format.value}"
             target_path = target_dir / target_filename
             
-            # Copy file to target location
-            shutil.copy2(source_path, target_path)
+            # Write content to target location
+            write(target_path)
             
-            # Verify file was copied correctly
+            # Verify file was written correctly
             if not target_path.exists():
-                logger.error(f"File copy failed: {target_path}")
+                logger.error(f"File write failed: {target_path}")
                 return None
             
             logger.info(f"Media file stored: {target_path}")
@@ -366,22 +444,22 @@ class MediaHandler:
             logger.error(f"Error storing media file: {e}")
             return None
     
-    async def _get_image_dimensions(self, file_path: Path) -> Optional[Tuple[int, int]]:
-        """Get image dimensions."""
+    async def _get_image_dimensions(self, source: Union[Path, bytes]) -> Optional[Tuple[int, int]]:
+        """Get image dimensions from a file or in-memory content."""
         try:
-            with Image.open(file_path) as img:
+            with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
                 return img.size
         except Exception as e:
             logger.debug(f"Could not get image dimensions: {e}")
             return None
     
-    async def _get_video_dimensions(self, file_path: Path) -> Optional[Tuple[int, int]]:
+    async def _get_video_dimensions(self, source: Union[Path, bytes]) -> Optional[Tuple[int, int]]:
         """Get video dimensions (placeholder implementation)."""
         # This would require video processing libraries like ffmpeg
         # For now, return None
         return None
     
-    async def _get_media_duration(self, file_path: Path) -> Optional[float]:
+    async def _get_media_duration(self, source: Union[Path, bytes]) -> Optional[float]:
         """Get media duration (placeholder implementation)."""
         # This would require audio/video processing libraries
         # For now, return None
@@ -520,12 +598,16 @@ class MediaHandler:
         try:
             file_path = await self.get_media_file(media_id, media_type, format_type)
             
-            if file_path and file_path.exists():
+            if not file_path:
+                return False
+            
+            try:
                 file_path.unlink()
-                logger.info(f"Media file deleted: {file_path}")
-                return True
+            except FileNotFoundError:
+                return False
             
-            return False
+            logger.info(f"Media file deleted: {file_path}")
+            return True
             
         except Exception as e:
             logger.error(f"Error deleting media file: {e}")
@@ -557,6 +639,7 @@ class MediaHandler:
             logger.error(f"Error cleaning up temp files: {e}")
             return 0
     
+    @ttl_cache(PROBE_CACHE_TTL)
     async def get_storage_stats(self) -> Dict[str, Any]:
         """Get storage statistics."""
         try:
@@ -607,6 +690,7 @@ class MediaHandler:
             logger.error(f"Error getting storage stats: {e}")
             return {"error": str(e)}
     
+    @ttl_cache(PROBE_CACHE_TTL)
     async def health_check(self) -> Dict[str, Any]:
         """Health check for the media handler."""
         try:
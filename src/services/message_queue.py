@@ -6,6 +6,7 @@ Uses Redis for reliable message queuing and delivery tracking.
 import asyncio
 import json
 import logging
+from collections import Counter
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Any, Callable, Awaitable
 from enum import Enum
@@ -13,8 +14,13 @@ from enum import Enum
 import aioredis
 from pydantic import BaseModel, Field
 
+from ._caching import PROBE_CACHE_TTL, ttl_cache
+
 logger = logging.getLogger(__name__)
 
+# Message metadata keys scanned and status-fetched per pipeline in get_queue_stats
+STATS_SCAN_BATCH = 500
+
 
 class MessageType(str, Enum):
     """Types of messages that can be queued."""
@@ -55,9 +61,19 @@ class QueueMessage(BaseModel):
 class MessageQueueService:
     """Redis-based message queue service."""
     
-    def __init__(self, redis_url: str = "redis://localhost:6379"):
-        """Initialize the message queue service."""
+    def __init__(self, redis_url: str = "redis://localhost:6379", max_connections: int = 10, key_prefix: str = ""):
+        """
+        Initialize the message queue service.
+        
+        Args:
+            redis_url: Redis connection URL
+            max_connections: Size of the Redis connection pool
+            key_prefix: Prefix for the queue key names, to keep e.g. test
+                runs apart from the application's queues
+        """
         self.redis_url = redis_url
+        self.max_connections = max_connections
+        self.key_prefix = key_prefix
         self.redis: Optional[aioredis.Redis] = None
         self.consumers: Dict[str, Callable] = {}
         self.running = False
@@ -65,28 +81,30 @@ class MessageQueueService:
         
         # Queue names
         self.queues = {
-            MessageType.INSTAGRAM_DM: "instagram_dm_queue",
-            MessageType.TELEGRAM_MESSAGE: "telegram_message_queue",
-            MessageType.NOTIFICATION: "notification_queue",
-            MessageType.SYNC_UPDATE: "sync_update_queue",
-            MessageType.MEDIA_UPDATE: "media_update_queue"
+            MessageType.INSTAGRAM_DM: f"{key_prefix}instagram_dm_queue",
+            MessageType.TELEGRAM_MESSAGE: f"{key_prefix}telegram_message_queue",
+            MessageType.NOTIFICATION: f"{key_prefix}notification_queue",
+            MessageType.SYNC_UPDATE: f"{key_prefix}sync_update_queue",
+            MessageType.MEDIA_UPDATE: f"{key_prefix}media_update_queue"
         }
         
         # Priority queues
         self.priority_queues = {
-            MessagePriority.URGENT: "urgent_queue",
-            MessagePriority.HIGH: "high_queue",
-            MessagePriority.NORMAL: "normal_queue",
-            MessagePriority.LOW: "low_queue"
+            MessagePriority.URGENT: f"{key_prefix}urgent_queue",
+            MessagePriority.HIGH: f"{key_prefix}high_queue",
+            MessagePriority.NORMAL: f"{key_prefix}normal_queue",
+            MessagePriority.LOW: f"{key_prefix}low_queue"
         }
     
     async def initialize(self):
         """Initialize Redis connection and setup queues."""
         try:
+            # One pooled client, shared by everything that uses this service
             self.redis = await aioredis.from_url(
                 self.redis_url,
                 encoding="utf-8",
-                decode_responses=True
+                decode_responses=True,
+                max_connections=self.max_connections
             )
             
             # Test connection
@@ -176,11 +194,14 @@ class MessageQueueService:
     async def dequeue_message(
         self,
         message_type: MessageType,
-        timeout: int = 1
+        timeout: float = 1
     ) -> Optional[QueueMessage]:
         """
         Dequeue a message from the specified queue.
         
+        Blocks in Redis (BRPOP) until a message arrives or the timeout
+        expires; fractional timeouts need Redis 6 or later.
+        
         Args:
             message_type: Type of message to dequeue
             timeout: Timeout in seconds
@@ -215,6 +236,18 @@ class MessageQueueService:
             logger.error(f"Failed to dequeue message from {message_type}: {e}")
             return None
     
+    async def get_message_status(self, message_id: str) -> Optional[str]:
+        """Get the delivery status of a message, or None if unknown."""
+        try:
+            if not self.redis:
+                raise RuntimeError("Message queue service not initialized")
+            
+            return await self.redis.hget(f"msg:{message_id}", "status")
+            
+        except Exception as e:
+            logger.error(f"Failed to get status of message {message_id}: {e}")
+            return None
+    
     async def mark_message_completed(self, message_id: str) -> bool:
         """Mark a message as completed."""
         try:
@@ -350,42 +383,46 @@ class MessageQueueService:
         
         logger.info(f"Consumer worker stopped for {message_type}")
     
+    async def _get_statuses(self, keys: List[str]) -> List[Optional[str]]:
+        """Fetch the status field of message metadata keys in one pipeline."""
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.hget(key, "status")
+        return await pipe.execute()
+    
+    @ttl_cache(PROBE_CACHE_TTL)
     async def get_queue_stats(self) -> Dict[str, Any]:
         """Get statistics about all queues."""
         try:
             if not self.redis:
                 return {"error": "Service not initialized"}
             
-            stats = {}
-            
-            for queue_name in self.queues.values():
-                length = await self.redis.llen(queue_name)
-                stats[queue_name] = length
-            
-            for priority_name in self.priority_queues.values():
-                length = await self.redis.llen(priority_name)
-                stats[priority_name] = length
-            
-            # Get processing stats
-            processing_count = 0
-            failed_count = 0
-            completed_count = 0
-            
-            # This is a simplified approach - in production you'd want more efficient counting
-            pattern = "msg:*"
-            async for key in self.redis.scan_iter(match=pattern):
-                status = await self.redis.hget(key, "status")
-                if status == "processing":
-                    processing_count += 1
-                elif status == "failed":
-                    failed_count += 1
-                elif status == "completed":
-                    completed_count += 1
+            # Queue lengths go out in one pipelined round-trip
+            queue_names = list(self.queues.values()) + list(self.priority_queues.values())
+            pipe = self.redis.pipeline(transaction=False)
+            for queue_name in queue_names:
+                pipe.llen(queue_name)
+            stats = dict(zip(queue_names, await pipe.execute()))
+            
+            # Get processing stats. This is a simplified approach - in production
+            # you'd want more efficient counting. Statuses are fetched one
+            # pipeline per SCAN batch, so memory and reply size stay bounded
+            # however many messages are tracked
+            status_counts = Counter()
+            keys = []
+            async for key in self.redis.scan_iter(match="msg:*", count=STATS_SCAN_BATCH):
+                keys.append(key)
+                if len(keys) == STATS_SCAN_BATCH:
+                    status_counts.update(await self._get_statuses(keys))
+                    keys = []
+            
+            if keys:
+                status_counts.update(await self._get_statuses(keys))
             
             stats.update({
-                "processing": processing_count,
-                "failed": failed_count,
-                "completed": completed_count
+                "processing": status_counts["processing"],
+                "failed": status_counts["failed"],
+                "completed": status_counts["completed"]
             })
             
             return stats
@@ -394,6 +431,7 @@ class MessageQueueService:
             logger.error(f"Failed to get queue stats: {e}")
             return {"error": str(e)}
     
+    @ttl_cache(PROBE_CACHE_TTL)
     async def health_check(self) -> Dict[str, Any]:
         """Health check for the message queue service."""
         try:
@@ -423,20 +461,26 @@ class MessageQueueService:
 
 # Global message queue service instance
 _message_queue_service: Optional[MessageQueueService] = None
+_message_queue_lock = asyncio.Lock()
 
 
 async def get_message_queue_service() -> MessageQueueService:
     """Get the global message queue service instance."""
     global _message_queue_service
     
-    if _message_queue_service is None:
-        from config.settings import get_settings
-        settings = get_settings()
-        
-        _message_queue_service = MessageQueueService(
-            redis_url=settings.redis_url
-        )
-        await _message_queue_service.initialize()
+    # Concurrent first callers (e.g. the realtime service initializing at the
+    # same time) wait for a single connection instead of each opening a pool
+    async with _message_queue_lock:
+        if _message_queue_service is None:
+            from config.settings import get_settings
+            settings = get_settings()
+            
+            service = MessageQueueService(
+                redis_url=settings.redis_url,
+                max_connections=settings.redis.redis_max_connections
+            )
+            await service.initialize()
+            _message_queue_service = service
     
     return _message_queue_service
 
@@ -15,6 +15,7 @@ import websockets
 from websockets.server import WebSocketServerProtocol
 from pydantic import BaseModel, Field
 
+from ._caching import PROBE_CACHE_TTL, ttl_cache
 from .message_queue import MessageQueueService, MessageType, QueueMessage, get_message_queue_service
 
 logger = logging.getLogger(__name__)
@@ -470,6 +471,7 @@ class RealtimeService:
             logger.error(f"Error getting connection stats: {e}")
             return {"error": str(e)}
     
+    @ttl_cache(PROBE_CACHE_TTL)
     async def health_check(self) -> Dict[str, Any]:
         """Health check for the real-time service."""
         try:
@@ -524,21 +526,26 @@ class RealtimeService:
 
 # Global real-time service instance
 _realtime_service: Optional[RealtimeService] = None
+_realtime_lock = asyncio.Lock()
 
 
 async def get_realtime_service() -> RealtimeService:
     """Get the global real-time service instance."""
     global _realtime_service
     
-    if _realtime_service is None:
-        from config.settings import get_settings
-        settings = get_settings()
-        
-        _realtime_service = RealtimeService(
-            host=settings.websocket_host,
-            port=settings.websocket_port
-        )
-        await _realtime_service.initialize()
+    # Concurrent first callers share one initialization (and one set of
+    # message queue consumers)
+    async with _realtime_lock:
+        if _realtime_service is None:
+            from config.settings import get_settings
+            settings = get_settings()
+            
+            service = RealtimeService(
+                host=settings.websocket_host,
+                port=settings.websocket_port
+            )
+            await service.initialize()
+            _realtime_service = service
     
     return _realtime_service
 
@@ -11,10 +11,40 @@ from dataclasses import dataclass
 
 from instagram.client import InstagramClient
 from database.operations import InstagramOperations
+from database.models import InstagramMessage, MessageType
 
 logger = logging.getLogger(__name__)
 
 
+def _message_from_client(message_data: Dict[str, Any]) -> InstagramMessage:
+    """
+    Convert a message dict from InstagramClient into a database model.
+    
+    Fields are normalized here, so the model is built with model_construct
+    and skips pydantic validation for every synced message.
+    
+    Args:
+        message_data: Message as returned by get_thread_messages
+        
+    Returns:
+        InstagramMessage ready to be inserted
+    """
+    message_type = MessageType._value2member_map_.get(message_data.get("message_type"), MessageType.UNKNOWN)
+    
+    timestamp = message_data.get("timestamp")
+    media_url = message_data.get("media_url")
+    
+    return InstagramMessage.model_construct(
+        message_id=str(message_data["id"]),
+        thread_id=str(message_data["thread_id"]),
+        sender_id=str(message_data.get("user_id")),
+        message_type=message_type,
+        content=message_data.get("text") or f"[{message_type.value}]",
+        media_urls=[media_url] if media_url else [],
+        instagram_timestamp=datetime.fromisoformat(timestamp) if timestamp else None
+    )
+
+
 @dataclass
 class SyncConfig:
     """Configuration for sync service."""
@@ -23,6 +53,7 @@ class SyncConfig:
     retry_delay: int = 60  # 1 minute
     batch_size: int = 50
     enable_realtime: bool = True
+    concurrency: int = 10  # Threads fetched from Instagram at once
 
 
 class InstagramSyncService:
@@ -170,26 +201,9 @@ class InstagramSyncService:
             # Get all threads
             threads = await self.db_ops.get_all_threads(limit=100)
             
-            for thread in threads:
-                try:
-                    # Get messages for this thread
-                    messages = await self.instagram_client.get_thread_messages(
-                        thread["thread_id"], 
-                        limit=self.config.batch_size
-                    )
-                    
-                    for message_data in messages:
-                        try:
-                            # Create or update message
-                            message_id = await self.db_ops.create_message(message_data)
-                            if message_id:
-                                self.sync_stats["total_messages_synced"] += 1
-                                
-                        except Exception as e:
-                            logger.error(f"Error syncing message {message_data.get('message_id')}: {e}")
-                    
-                except Exception as e:
-                    logger.error(f"Error syncing messages for thread {thread.get('thread_id')}: {e}")
+            # Fetch threads concurrently, capped to stay within Instagram's rate limits
+            semaphore = asyncio.Semaphore(self.config.concurrency)
+            await asyncio.gather(*(self._sync_thread_messages(semaphore, thread) for thread in threads))
             
             logger.info(f"Messages sync completed")
             
@@ -197,6 +211,36 @@ class InstagramSyncService:
             logger.error(f"Messages sync failed: {e}")
             raise
     
+    async def _sync_thread_messages(self, semaphore: asyncio.Semaphore, thread: Dict[str, Any]):
+        """
+        Sync messages of a single thread.
+        
+        Args:
+            semaphore: Limits concurrent Instagram requests
+            thread: Thread document from the database
+        """
+        try:
+            async with semaphore:
+                # Get messages for this thread
+                messages = await self.instagram_client.get_thread_messages(
+                    thread["thread_id"], 
+                    limit=self.config.batch_size
+                )
+            
+            # Buffer the thread's messages and save the new ones with one bulk_write
+            batch = []
+            for message_data in messages:
+                try:
+                    batch.append(_message_from_client(message_data))
+                except Exception as e:
+                    logger.error(f"Error syncing message {message_data.get('id')}: {e}")
+            
+            created = await self.db_ops.create_many(messages=batch)
+            self.sync_stats["total_messages_synced"] += created["messages"]
+            
+        except Exception as e:
+            logger.error(f"Error syncing messages for thread {thread.get('thread_id')}: {e}")
+    
     async def _handle_sync_error(self, error: Exception):
         """Handle sync errors with retry logic."""
         logger.error(f"Handling sync error: {error}")
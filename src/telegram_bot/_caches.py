@@ -0,0 +1,91 @@
+"""
+Short-lived caches for Instagram user and thread metadata used by the bot.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class TTLCache:
+    """LRU cache whose entries expire a fixed number of seconds after insertion."""
+    
+    def __init__(self, maxsize: int = 10_000, ttl: float = 300.0):
+        """
+        Initialize the cache.
+        
+        Args:
+            maxsize: Maximum number of entries kept
+            ttl: Entry lifetime in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a cached value, or None if missing or expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        
+        self._data.move_to_end(key)
+        return value
+    
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry when full."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def invalidate(self, key: Hashable):
+        """Drop a single entry."""
+        self._data.pop(key, None)
+    
+    def clear(self):
+        """Drop all entries."""
+        self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+user_cache = TTLCache()
+thread_cache = TTLCache()
+
+
+async def _get_many_cached(cache: TTLCache, keys: Iterable[Hashable], fetch_many) -> Dict[Hashable, Any]:
+    """Serve keys from the cache and fetch the misses with one batch call."""
+    found: Dict[Hashable, Any] = {}
+    missing: List[Hashable] = []
+    for key in keys:
+        if not key:
+            continue
+        value = cache.get(key)
+        if value is None:
+            missing.append(key)
+        else:
+            found[key] = value
+    
+    if missing:
+        fetched = await fetch_many(missing)
+        for key, value in fetched.items():
+            cache.set(key, value)
+        found.update(fetched)
+    
+    return found
+
+
+async def get_users_by_ids_cached(db_ops, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Get users by Instagram ID, querying the database only for cache misses."""
+    return await _get_many_cached(user_cache, user_ids, db_ops.get_users_by_ids)
+
+
+async def get_threads_by_ids_cached(db_ops, thread_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Get threads by ID, querying the database only for cache misses."""
+    return await _get_many_cached(thread_cache, thread_ids, db_ops.get_threads_by_ids)
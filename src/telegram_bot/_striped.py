@@ -0,0 +1,95 @@
+"""
+Striped-lock dictionary for state shared between concurrent bot workers.
+"""
+
+import asyncio
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Tuple
+
+
+class StripedDict:
+    """
+    Dictionary split into independently locked shards.
+    
+    Reads are lock-free. Writes go through the async methods and only hold
+    the lock of the shard owning the key, so writers for different keys do
+    not block each other.
+    """
+    
+    def __init__(self, stripes: int = 16):
+        """
+        Initialize the dictionary.
+        
+        Args:
+            stripes: Number of shards (and locks)
+        """
+        self._shards: List[Dict[Hashable, Any]] = [{} for _ in range(stripes)]
+        self._locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(stripes)]
+    
+    def _index(self, key: Hashable) -> int:
+        return hash(key) % len(self._shards)
+    
+    def lock(self, key: Hashable) -> asyncio.Lock:
+        """Get the lock guarding a key, for multi-step updates."""
+        return self._locks[self._index(key)]
+    
+    async def set(self, key: Hashable, value: Any):
+        """Store a value under the key's shard lock."""
+        index = self._index(key)
+        async with self._locks[index]:
+            self._shards[index][key] = value
+    
+    async def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove and return a value under the key's shard lock."""
+        index = self._index(key)
+        async with self._locks[index]:
+            return self._shards[index].pop(key, default)
+    
+    async def pop_if(self, key: Hashable, predicate: Callable[[Any], bool]) -> Any:
+        """
+        Remove and return a value only if it still satisfies a predicate.
+        
+        The check and the removal happen under the shard lock, so a value
+        replaced by another writer in between is left alone.
+        
+        Args:
+            key: Key to remove
+            predicate: Called with the current value
+            
+        Returns:
+            The removed value, or None if missing or the predicate failed
+        """
+        index = self._index(key)
+        async with self._locks[index]:
+            shard = self._shards[index]
+            value = shard.get(key)
+            if value is None or not predicate(value):
+                return None
+            return shard.pop(key)
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value without locking."""
+        return self._shards[self._index(key)].get(key, default)
+    
+    def __getitem__(self, key: Hashable) -> Any:
+        return self._shards[self._index(key)][key]
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._shards[self._index(key)]
+    
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+    
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.keys())
+    
+    def keys(self) -> List[Hashable]:
+        """Snapshot of all keys, taken shard by shard."""
+        return [key for shard in self._shards for key in list(shard)]
+    
+    def values(self) -> List[Any]:
+        """Snapshot of all values, taken shard by shard."""
+        return [value for shard in self._shards for value in list(shard.values())]
+    
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Snapshot of all items, taken shard by shard."""
+        return [item for shard in self._shards for item in list(shard.items())]
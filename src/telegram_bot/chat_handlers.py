@@ -2,25 +2,184 @@
 Chat handlers for managing active chat sessions and message threading.
 """
 
+import heapq
 import logging
-from typing import Dict, Any, Optional, List
+import time
+from collections import deque
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 from ..database.operations import InstagramOperations
 from .session import UserSession
+from ._striped import StripedDict
 
 logger = logging.getLogger(__name__)
 
+# Chat sessions shared through Redis expire after a day without activity
+CHAT_SESSION_TTL = 24 * 3600
+CHAT_KEY_PREFIX = "chat:"
+# Recent messages kept per chat session, newest first
+MAX_SESSION_MESSAGES = 50
+# Chat session hashes fetched per pipeline when listing sessions from Redis
+CHAT_SCAN_BATCH = 200
+# Updates a chat session hash and refreshes its TTL only if the key still
+# exists, so a session ended (deleted) by another replica stays ended.
+# KEYS[1] = session key, ARGV[1] = TTL, ARGV[2..] = field/value pairs
+_UPDATE_CHAT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
 
 class ChatHandler:
     """Handles active chat sessions and message threading."""
     
-    def __init__(self):
-        """Initialize the chat handler."""
+    def __init__(self, redis: Optional[Any] = None):
+        """
+        Initialize the chat handler.
+        
+        Args:
+            redis: Optional aioredis client used to share chat sessions
+                between bot replicas; sessions stay in-process when omitted.
+                When given, Redis is the only copy of a session and expires
+                it through its TTL. It must be created with decode_responses=True
+        
+        Raises:
+            ValueError: If the Redis client returns bytes instead of strings
+        """
+        if redis is not None and not redis.connection_pool.connection_kwargs.get("decode_responses"):
+            raise ValueError("ChatHandler needs a Redis client created with decode_responses=True")
+        
         self.db_ops = InstagramOperations()
-        self.active_chats: Dict[int, Dict[str, Any]] = {}
+        self.redis = redis
+        # In-process sessions, only used without Redis
+        self.active_chats = StripedDict()
+        # Min-heap of (last_activity_mono, user_id); entries superseded by newer
+        # activity are discarded lazily during cleanup.
+        self._activity_heap: List[Tuple[float, int]] = []
+    
+    def _touch_chat(self, user_id: int, chat_session: Dict[str, Any], now: Optional[datetime] = None):
+        """Record activity on a chat session and schedule it for expiry checks."""
+        now_mono = time.monotonic()
+        chat_session["last_activity"] = now or datetime.now()
+        chat_session["last_activity_mono"] = now_mono
+        if self.redis is None:
+            heapq.heappush(self._activity_heap, (now_mono, user_id))
+    
+    @staticmethod
+    def _chat_info(chat_session: Dict[str, Any]) -> Dict[str, Any]:
+        """Public view of a chat session, without cached messages or internal fields."""
+        return {
+            "user_id": chat_session["user_id"],
+            "thread_id": chat_session["thread_id"],
+            "thread_title": chat_session["thread_title"],
+            "started_at": chat_session["started_at"],
+            "last_activity": chat_session["last_activity"],
+            "current_page": chat_session["current_page"],
+            "is_active": chat_session["is_active"]
+        }
+    
+    @staticmethod
+    def _chat_from_hash(user_id: int, data: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Build the public view of a chat session stored in Redis.
+        
+        Raises:
+            KeyError, ValueError: If the hash is missing fields or malformed
+        """
+        return {
+            "user_id": user_id,
+            "thread_id": data["thread_id"],
+            "thread_title": data.get("thread_title", "Untitled"),
+            "started_at": datetime.fromisoformat(data["started_at"]),
+            "last_activity": datetime.fromisoformat(data["last_activity"]),
+            "current_page": int(data.get("current_page", 1)),
+            "is_active": True
+        }
+    
+    async def _save_chat(self, user_id: int, chat_session: Dict[str, Any], create: bool = False) -> bool:
+        """
+        Write chat session metadata to Redis and refresh its TTL.
+        
+        Args:
+            user_id: Telegram user ID
+            chat_session: Chat session dict
+            create: Create the hash; otherwise only an existing one is updated
+            
+        Returns:
+            bool: False if the write failed or the session no longer exists
+        """
+        if self.redis is None:
+            return True
+        
+        key = f"{CHAT_KEY_PREFIX}{user_id}"
+        fields = {
+            "thread_id": chat_session["thread_id"],
+            "thread_title": chat_session["thread_title"],
+            "started_at": chat_session["started_at"].isoformat(),
+            "last_activity": chat_session["last_activity"].isoformat(),
+            "current_page": chat_session["current_page"]
+        }
+        
+        try:
+            if create:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.hset(key, mapping=fields)
+                pipe.expire(key, CHAT_SESSION_TTL)
+                await pipe.execute()
+                return True
+            
+            args = [item for field in fields.items() for item in field]
+            return bool(await self.redis.eval(_UPDATE_CHAT_SCRIPT, 1, key, CHAT_SESSION_TTL, *args))
+        except Exception as e:
+            logger.warning(f"Failed to store chat session for user {user_id} in Redis: {e}")
+            return False
+    
+    async def _get_chat(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a chat session.
+        
+        With Redis the session is read from its hash on every access, so a
+        session ended or expired there is never served from a stale copy.
+        
+        Args:
+            user_id: Telegram user ID
+            
+        Returns:
+            Chat session dict or None if there is no active session
+        """
+        if self.redis is None:
+            return self.active_chats.get(user_id)
+        
+        try:
+            data = await self.redis.hgetall(f"{CHAT_KEY_PREFIX}{user_id}")
+        except Exception as e:
+            logger.warning(f"Failed to load chat session for user {user_id} from Redis: {e}")
+            return None
+        
+        if not data:
+            return None
+        
+        try:
+            chat_session = self._chat_from_hash(user_id, data)
+        except (KeyError, ValueError) as e:
+            logger.warning(f"Ignoring malformed chat session for user {user_id} in Redis: {e}")
+            return None
+        
+        now = datetime.now()
+        now_mono = time.monotonic()
+        chat_session.update({
+            "started_at_mono": now_mono - (now - chat_session["started_at"]).total_seconds(),
+            "last_activity_mono": now_mono - (now - chat_session["last_activity"]).total_seconds(),
+            "messages": deque(maxlen=MAX_SESSION_MESSAGES)
+        })
+        return chat_session
     
     async def start_chat_session(self, user_id: int, thread_id: str, session: UserSession) -> Dict[str, Any]:
         """
@@ -44,19 +203,28 @@ class ChatHandler:
             messages = await self.db_ops.get_thread_messages(thread_id, limit=20)
             
             # Create chat session
+            now = datetime.now()
+            now_mono = time.monotonic()
             chat_session = {
                 "user_id": user_id,
                 "thread_id": thread_id,
                 "thread_title": thread.get("title", "Untitled"),
-                "started_at": datetime.now(),
-                "last_activity": datetime.now(),
-                "messages": messages,
+                "started_at": now,
+                "last_activity": now,
+                "started_at_mono": now_mono,
+                "last_activity_mono": now_mono,
+                "messages": deque(messages, maxlen=MAX_SESSION_MESSAGES),
                 "current_page": 1,
                 "is_active": True
             }
             
-            # Store in active chats
-            self.active_chats[user_id] = chat_session
+            # Store in Redis, or in process without it
+            if self.redis is not None:
+                if not await self._save_chat(user_id, chat_session, create=True):
+                    return {"error": "Failed to store chat session"}
+            else:
+                await self.active_chats.set(user_id, chat_session)
+                heapq.heappush(self._activity_heap, (now_mono, user_id))
             
             # Update user session
             session.set_current_thread(thread_id)
@@ -80,8 +248,11 @@ class ChatHandler:
             bool: True if successful
         """
         try:
-            if user_id in self.active_chats:
-                del self.active_chats[user_id]
+            removed = await self.active_chats.pop(user_id) is not None
+            if self.redis is not None:
+                removed = bool(await self.redis.delete(f"{CHAT_KEY_PREFIX}{user_id}")) or removed
+            
+            if removed:
                 session.clear_session()
                 logger.info(f"Ended chat session for user {user_id}")
                 return True
@@ -104,10 +275,10 @@ class ChatHandler:
             Dict containing result info
         """
         try:
-            if user_id not in self.active_chats:
+            chat_session = await self._get_chat(user_id)
+            if chat_session is None:
                 return {"error": "No active chat session"}
             
-            chat_session = self.active_chats[user_id]
             thread_id = chat_session["thread_id"]
             
             # Create message data
@@ -126,11 +297,12 @@ class ChatHandler:
                 return {"error": "Failed to store message"}
             
             # Update chat session
-            chat_session["last_activity"] = datetime.now()
-            chat_session["messages"].insert(0, {
+            self._touch_chat(user_id, chat_session, message_data["timestamp"])
+            await self._save_chat(user_id, chat_session)
+            chat_session["messages"].appendleft({
                 "id": message_id,
                 "text": message_text,
-                "timestamp": datetime.now(),
+                "timestamp": message_data["timestamp"],
                 "is_from_telegram": True
             })
             
@@ -157,26 +329,29 @@ class ChatHandler:
             Dict containing chat history
         """
         try:
-            if user_id not in self.active_chats:
+            chat_session = await self._get_chat(user_id)
+            if chat_session is None:
                 return {"error": "No active chat session"}
             
-            chat_session = self.active_chats[user_id]
             thread_id = chat_session["thread_id"]
             
             # Calculate offset
             offset = (page - 1) * limit
             
-            # Get messages from database
-            messages = await self.db_ops.get_thread_messages(thread_id, limit=limit, offset=offset)
+            # Fetch one extra row to know whether another page exists
+            rows = await self.db_ops.get_thread_messages(thread_id, limit=limit + 1, offset=offset)
+            has_next = len(rows) > limit
+            messages = rows[:limit]
             
             # Update chat session
             chat_session["current_page"] = page
-            chat_session["last_activity"] = datetime.now()
+            self._touch_chat(user_id, chat_session)
+            await self._save_chat(user_id, chat_session)
             
             return {
                 "messages": messages,
                 "current_page": page,
-                "has_next": len(messages) == limit,
+                "has_next": has_next,
                 "has_previous": page > 1
             }
             
@@ -197,17 +372,18 @@ class ChatHandler:
             Dict containing search results
         """
         try:
-            if user_id not in self.active_chats:
+            chat_session = await self._get_chat(user_id)
+            if chat_session is None:
                 return {"error": "No active chat session"}
             
-            chat_session = self.active_chats[user_id]
             thread_id = chat_session["thread_id"]
             
             # Search messages in the thread
             results = await self.db_ops.search_messages(query, thread_id=thread_id, limit=limit)
             
             # Update chat session
-            chat_session["last_activity"] = datetime.now()
+            self._touch_chat(user_id, chat_session)
+            await self._save_chat(user_id, chat_session)
             
             return {
                 "results": results,
@@ -229,11 +405,9 @@ class ChatHandler:
         Returns:
             Dict containing chat session info or None
         """
-        if user_id in self.active_chats:
-            chat_session = self.active_chats[user_id].copy()
-            # Remove sensitive data
-            chat_session.pop("messages", None)
-            return chat_session
+        chat_session = await self._get_chat(user_id)
+        if chat_session is not None:
+            return self._chat_info(chat_session)
         return None
     
     async def get_all_active_chats(self) -> List[Dict[str, Any]]:
@@ -243,41 +417,106 @@ class ChatHandler:
         Returns:
             List of active chat sessions
         """
+        if self.redis is None:
+            return [
+                self._chat_info(chat_session)
+                for chat_session in self.active_chats.values()
+                if chat_session["is_active"]
+            ]
+        
+        # Sessions of all bot replicas live in Redis
         active_chats = []
-        for user_id, chat_session in self.active_chats.items():
-            if chat_session["is_active"]:
-                chat_info = chat_session.copy()
-                chat_info.pop("messages", None)
-                active_chats.append(chat_info)
+        try:
+            keys = []
+            async for key in self.redis.scan_iter(match=f"{CHAT_KEY_PREFIX}*", count=CHAT_SCAN_BATCH):
+                keys.append(key)
+                if len(keys) == CHAT_SCAN_BATCH:
+                    active_chats.extend(await self._load_chats(keys))
+                    keys = []
+            
+            if keys:
+                active_chats.extend(await self._load_chats(keys))
+        except Exception as e:
+            logger.warning(f"Failed to list chat sessions from Redis: {e}")
+        
         return active_chats
     
+    async def _load_chats(self, keys: List[str]) -> List[Dict[str, Any]]:
+        """
+        Fetch chat sessions stored in Redis with one pipelined round-trip.
+        
+        Malformed keys or hashes are skipped.
+        
+        Args:
+            keys: Chat session keys returned by SCAN
+            
+        Returns:
+            List of chat session info dicts
+        """
+        user_ids = []
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            try:
+                user_id = int(key[len(CHAT_KEY_PREFIX):])
+            except ValueError:
+                logger.warning(f"Ignoring malformed chat session key in Redis: {key}")
+                continue
+            user_ids.append(user_id)
+            pipe.hgetall(key)
+        
+        if not user_ids:
+            return []
+        
+        chats = []
+        for user_id, data in zip(user_ids, await pipe.execute()):
+            if not data:
+                continue
+            try:
+                chats.append(self._chat_from_hash(user_id, data))
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Ignoring malformed chat session for user {user_id} in Redis: {e}")
+        
+        return chats
+    
     async def cleanup_inactive_chats(self, max_inactive_hours: int = 24) -> int:
         """
         Clean up inactive chat sessions.
         
+        Sessions stored in Redis expire there through their TTL, so this is
+        a no-op with Redis and only evicts in-process sessions without it.
+        
         Args:
             max_inactive_hours: Maximum hours of inactivity
             
         Returns:
             int: Number of sessions cleaned up
         """
+        if self.redis is not None:
+            return 0
+        
         try:
-            current_time = datetime.now()
+            threshold = time.monotonic() - max_inactive_hours * 3600
+            heap = self._activity_heap
+            expired = []
+            
+            # Collect candidates without yielding; only entries older than the
+            # threshold are visited
+            while heap and heap[0][0] < threshold:
+                activity_mono, user_id = heapq.heappop(heap)
+                chat_session = self.active_chats.get(user_id)
+                # Skip entries for ended sessions or sessions with newer activity
+                if chat_session is not None and chat_session["last_activity_mono"] == activity_mono:
+                    expired.append((user_id, activity_mono))
+            
+            # Re-check under the shard lock in case a session was touched meanwhile
             inactive_users = []
-            
-            for user_id, chat_session in self.active_chats.items():
-                last_activity = chat_session["last_activity"]
-                if isinstance(last_activity, str):
-                    last_activity = datetime.fromisoformat(last_activity.replace('Z', '+00:00'))
-                
-                inactive_time = current_time - last_activity
-                if inactive_time.total_seconds() > (max_inactive_hours * 3600):
+            for user_id, activity_mono in expired:
+                removed = await self.active_chats.pop_if(
+                    user_id, lambda chat, ts=activity_mono: chat["last_activity_mono"] == ts
+                )
+                if removed is not None:
                     inactive_users.append(user_id)
             
-            # Remove inactive sessions
-            for user_id in inactive_users:
-                del self.active_chats[user_id]
-            
             logger.info(f"Cleaned up {len(inactive_users)} inactive chat sessions")
             return len(inactive_users)
             
@@ -289,27 +528,23 @@ class ChatHandler:
         """
         Get statistics about active chat sessions.
         
+        Only covers in-process sessions; with Redis, sessions are listed
+        through get_all_active_chats.
+        
         Returns:
             Dict containing chat statistics
         """
         try:
-            total_sessions = len(self.active_chats)
-            active_sessions = sum(1 for chat in self.active_chats.values() if chat["is_active"])
+            total_sessions = 0
+            active_sessions = 0
+            total_duration = 0.0
             
-            # Calculate average session duration
-            total_duration = 0
+            # Count sessions and sum durations in a single pass
             for chat in self.active_chats.values():
-                if chat["started_at"] and chat["last_activity"]:
-                    started = chat["started_at"]
-                    last_activity = chat["last_activity"]
-                    
-                    if isinstance(started, str):
-                        started = datetime.fromisoformat(started.replace('Z', '+00:00'))
-                    if isinstance(last_activity, str):
-                        last_activity = datetime.fromisoformat(last_activity.replace('Z', '+00:00'))
-                    
-                    duration = (last_activity - started).total_seconds()
-                    total_duration += duration
+                total_sessions += 1
+                if chat["is_active"]:
+                    active_sessions += 1
+                total_duration += chat["last_activity_mono"] - chat["started_at_mono"]
             
             avg_duration = total_duration / total_sessions if total_sessions > 0 else 0
             
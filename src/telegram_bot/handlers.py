@@ -2,13 +2,26 @@
 Command handlers for the Telegram bot.
 """
 
+import asyncio
 import logging
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 from database.operations import InstagramOperations
 
+try:
+    # C parser, much faster than datetime.fromisoformat for per-message formatting
+    from ciso8601 import parse_datetime as _parse_iso_timestamp
+except ImportError:
+    def _parse_iso_timestamp(timestamp: str) -> datetime:
+        return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+from ._caches import get_users_by_ids_cached, get_threads_by_ids_cached
+
 logger = logging.getLogger(__name__)
 
+# (seconds, label) pairs used by _format_timestamp, largest unit first
+_TIME_UNITS = ((86400, "day"), (3600, "hour"), (60, "minute"))
+
 
 class CommandHandlers:
     """Handles bot commands and database operations."""
@@ -60,11 +73,13 @@ class CommandHandlers:
         try:
             messages = await self.db_ops.get_thread_messages(thread_id, limit)
             
+            # Resolve all message authors, querying only uncached ones
+            users = await get_users_by_ids_cached(self.db_ops, {msg.get('user_id') for msg in messages})
+            
             # Format messages for display
             formatted_messages = []
             for msg in messages:
-                # Get user info for the message
-                user_info = await self.db_ops.get_user_info(msg.get('user_id'))
+                user_info = users.get(msg.get('user_id'))
                 
                 formatted_message = {
                     'id': msg.get('message_id'),
@@ -79,9 +94,7 @@ class CommandHandlers:
                 }
                 formatted_messages.append(formatted_message)
             
-            # Sort by timestamp (newest first)
-            formatted_messages.sort(key=lambda x: x['timestamp'], reverse=True)
-            
+            # Messages already come back newest first from the database
             return formatted_messages
             
         except Exception as e:
@@ -102,12 +115,17 @@ class CommandHandlers:
         try:
             results = await self.db_ops.search_messages(query, limit)
             
+            # Resolve all users and threads up front, querying only uncached ones
+            users, threads = await asyncio.gather(
+                get_users_by_ids_cached(self.db_ops, {result.get('user_id') for result in results}),
+                get_threads_by_ids_cached(self.db_ops, {result.get('thread_id') for result in results})
+            )
+            
             # Format search results for display
             formatted_results = []
             for result in results:
-                # Get user and thread info
-                user_info = await self.db_ops.get_user_info(result.get('user_id'))
-                thread_info = await self.db_ops.get_thread(result.get('thread_id'))
+                user_info = users.get(result.get('user_id'))
+                thread_info = threads.get(result.get('thread_id'))
                 
                 formatted_result = {
                     'id': result.get('message_id'),
@@ -134,22 +152,36 @@ class CommandHandlers:
             Dictionary with status information
         """
         try:
-            # Get database status
-            db_status = await self.db_ops.test_connection()
-            
-            # Get counts
-            thread_count = await self.db_ops.get_thread_count()
-            message_count = await self.db_ops.get_message_count()
+            # Database status, counts and last sync time are independent queries
+            db_status, thread_count, message_count, last_sync = await asyncio.gather(
+                self.db_ops.test_connection(),
+                self.db_ops.get_thread_count(),
+                self.db_ops.get_message_count(),
+                self.db_ops.get_last_sync_time(),
+                return_exceptions=True
+            )
+            
+            for name, result in (('database status', db_status), ('thread count', thread_count),
+                                 ('message count', message_count), ('last sync time', last_sync)):
+                if isinstance(result, Exception):
+                    logger.error(f"Error getting {name}: {result}")
+            
+            if isinstance(db_status, Exception):
+                connection = 'Unknown'
+            else:
+                connection = 'Connected' if db_status else 'Disconnected'
             
-            # Get last sync time (this would come from Instagram monitor)
-            last_sync = await self.db_ops.get_last_sync_time()
+            if isinstance(last_sync, Exception):
+                last_sync_display = 'Unknown'
+            else:
+                last_sync_display = self._format_timestamp(last_sync) if last_sync else 'Never'
             
             status = {
-                'instagram': 'Connected' if db_status else 'Disconnected',
-                'database': 'Connected' if db_status else 'Disconnected',
-                'last_sync': self._format_timestamp(last_sync) if last_sync else 'Never',
-                'thread_count': thread_count,
-                'message_count': message_count
+                'instagram': connection,
+                'database': connection,
+                'last_sync': last_sync_display,
+                'thread_count': 'Unknown' if isinstance(thread_count, Exception) else thread_count,
+                'message_count': 'Unknown' if isinstance(message_count, Exception) else message_count
             }
             
             return status
@@ -178,28 +210,23 @@ class CommandHandlers:
             return 'Unknown'
         
         try:
-            if isinstance(timestamp, str):
-                # Parse ISO format string
-                dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-            elif isinstance(timestamp, datetime):
+            # MongoDB returns BSON dates as datetime, so check that first
+            if isinstance(timestamp, datetime):
                 dt = timestamp
+            elif isinstance(timestamp, str):
+                dt = _parse_iso_timestamp(timestamp)
             else:
                 return 'Unknown'
             
             now = datetime.now(dt.tzinfo) if dt.tzinfo else datetime.now()
-            diff = now - dt
-            
-            if diff.days > 0:
-                return f"{diff.days} day{'s' if diff.days != 1 else ''} ago"
-            elif diff.seconds > 3600:
-                hours = diff.seconds // 3600
-                return f"{hours} hour{'s' if hours != 1 else ''} ago"
-            elif diff.seconds > 60:
-                minutes = diff.seconds // 60
-                return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
-            else:
-                return "Just now"
-                
+            seconds = (now - dt).total_seconds()
+            
+            for unit_seconds, unit in _TIME_UNITS:
+                if seconds >= unit_seconds:
+                    count = int(seconds // unit_seconds)
+                    return f"{count} {unit}{'s' if count != 1 else ''} ago"
+            return "Just now"
+            
         except Exception as e:
             logger.error(f"Error formatting timestamp: {e}")
             return 'Unknown' 
\ No newline at end of file
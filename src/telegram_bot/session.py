@@ -3,15 +3,28 @@ User session management for the Telegram bot.
 """
 
 import logging
+import math
+import time
+from collections import deque
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# Hours without activity after which a session no longer counts as active
+SESSION_INACTIVE_HOURS = 24
+
 
 class UserSession:
     """Manages user session state and preferences."""
     
+    __slots__ = (
+        "user_id", "created_at", "last_activity", "last_activity_mono",
+        "current_thread_id", "current_page", "search_query", "preferences",
+        "rate_limit_window", "max_commands_per_window", "_tokens",
+        "_tokens_updated", "_recent_commands"
+    )
+    
     def __init__(self, user_id: int):
         """
         Initialize a user session.
@@ -22,24 +35,27 @@ class UserSession:
         self.user_id = user_id
         self.created_at = datetime.now()
         self.last_activity = datetime.now()
+        self.last_activity_mono = time.monotonic()
         
         # Session state
         self.current_thread_id = None
         self.current_page = 1
         self.search_query = None
-        self.preferences = {}
+        self.preferences: Optional[Dict[str, Any]] = None  # Created on first set_preference
         
-        # Rate limiting
-        self.command_count = 0
-        self.last_command_time = None
+        # Rate limiting (token bucket refilling max_commands_per_window per window)
         self.rate_limit_window = 60  # 1 minute
         self.max_commands_per_window = 30
+        self._tokens = float(self.max_commands_per_window)
+        self._tokens_updated = time.monotonic()
+        self._recent_commands: deque = deque()  # Monotonic times for can_execute_strict
     
     def update_activity(self):
         """Update the last activity timestamp."""
         self.last_activity = datetime.now()
+        self.last_activity_mono = time.monotonic()
     
-    def is_active(self, max_inactive_hours: int = 24) -> bool:
+    def is_active(self, max_inactive_hours: int = SESSION_INACTIVE_HOURS) -> bool:
         """
         Check if the session is still active.
         
@@ -49,11 +65,7 @@ class UserSession:
         Returns:
             bool: True if session is active
         """
-        if not self.last_activity:
-            return False
-        
-        inactive_time = datetime.now() - self.last_activity
-        return inactive_time.total_seconds() < (max_inactive_hours * 3600)
+        return time.monotonic() - self.last_activity_mono < max_inactive_hours * 3600
     
     def set_current_thread(self, thread_id: str):
         """Set the current thread being viewed."""
@@ -100,16 +112,20 @@ class UserSession:
     
     def set_preference(self, key: str, value: Any):
         """Set a user preference."""
+        if self.preferences is None:
+            self.preferences = {}
         self.preferences[key] = value
         self.update_activity()
     
     def get_preference(self, key: str, default: Any = None) -> Any:
         """Get a user preference."""
+        if self.preferences is None:
+            return default
         return self.preferences.get(key, default)
     
     def get_preferences(self) -> Dict[str, Any]:
         """Get all user preferences."""
-        return self.preferences.copy()
+        return self.preferences.copy() if self.preferences else {}
     
     def can_execute_command(self) -> bool:
         """
@@ -118,17 +134,46 @@ class UserSession:
         Returns:
             bool: True if command can be executed
         """
-        now = datetime.now()
+        now = time.monotonic()
+        capacity = self.max_commands_per_window
+        
+        # Refill tokens for the time elapsed since the last check
+        refill = (now - self._tokens_updated) * capacity / self.rate_limit_window
+        self._tokens = min(capacity, self._tokens + refill)
+        self._tokens_updated = now
+        
+        if self._tokens >= 1:
+            self._tokens -= 1
+            self.update_activity()
+            return True
+        
+        return False
+    
+    def can_execute_strict(self, now: Optional[float] = None) -> bool:
+        """
+        Check if the user can execute a command using a sliding window.
+        
+        Unlike can_execute_command, this never allows a burst across a
+        window boundary: at most max_commands_per_window commands are
+        accepted in any rate_limit_window seconds.
+        
+        Args:
+            now: Current monotonic time, taken from time.monotonic() if omitted
+            
+        Returns:
+            bool: True if command can be executed
+        """
+        if now is None:
+            now = time.monotonic()
         
-        # Reset counter if window has passed
-        if (self.last_command_time and 
-            (now - self.last_command_time).total_seconds() > self.rate_limit_window):
-            self.command_count = 0
+        # Drop commands that have left the window
+        cutoff = now - self.rate_limit_window
+        recent = self._recent_commands
+        while recent and recent[0] < cutoff:
+            recent.popleft()
         
-        # Check if under limit
-        if self.command_count < self.max_commands_per_window:
-            self.command_count += 1
-            self.last_command_time = now
+        if len(recent) < self.max_commands_per_window:
+            recent.append(now)
             self.update_activity()
             return True
         
@@ -138,34 +183,30 @@ class UserSession:
         """
         Get rate limiting information.
         
+        Derived from the token count cached by the last can_execute_command
+        call, so no clock read is needed.
+        
         Returns:
             Dictionary with rate limit info
         """
-        if not self.last_command_time:
-            return {
-                'commands_used': 0,
-                'commands_remaining': self.max_commands_per_window,
-                'max_commands': self.max_commands_per_window,
-                'window_resets_in': 0,
-                'wait_time': 0
-            }
-        
-        now = datetime.now()
-        time_since_last = (now - self.last_command_time).total_seconds()
-        window_resets_in = max(0, self.rate_limit_window - time_since_last)
+        capacity = self.max_commands_per_window
+        tokens = self._tokens
+        rate = capacity / self.rate_limit_window
+        commands_remaining = int(tokens)
         
         return {
-            'commands_used': self.command_count,
-            'commands_remaining': max(0, self.max_commands_per_window - self.command_count),
-            'max_commands': self.max_commands_per_window,
-            'window_resets_in': int(window_resets_in),
-            'wait_time': int(window_resets_in)
+            'commands_used': capacity - commands_remaining,
+            'commands_remaining': commands_remaining,
+            'max_commands': capacity,
+            'window_resets_in': int((capacity - tokens) / rate) if tokens < capacity else 0,
+            'wait_time': math.ceil((1 - tokens) / rate) if tokens < 1 else 0
         }
     
     def reset_rate_limit(self):
         """Reset the rate limit counter."""
-        self.command_count = 0
-        self.last_command_time = None
+        self._tokens = float(self.max_commands_per_window)
+        self._tokens_updated = time.monotonic()
+        self._recent_commands.clear()
     
     def get_session_info(self) -> Dict[str, Any]:
         """
@@ -181,7 +222,7 @@ class UserSession:
             'current_thread_id': self.current_thread_id,
             'current_page': self.current_page,
             'search_query': self.search_query,
-            'preferences': self.preferences,
+            'preferences': self.preferences or {},
             'is_active': self.is_active(),
             'rate_limit_info': self.get_rate_limit_info()
         }
@@ -191,9 +232,10 @@ class UserSession:
         self.current_thread_id = None
         self.current_page = 1
         self.search_query = None
-        self.preferences = {}
-        self.command_count = 0
-        self.last_command_time = None
+        self.preferences = None
+        self._tokens = float(self.max_commands_per_window)
+        self._tokens_updated = time.monotonic()
+        self._recent_commands.clear()
         self.update_activity()
     
     def __str__(self) -> str:
@@ -263,17 +305,20 @@ class TelegramSessionManager:
             del self.sessions[user_id]
             logger.info(f"Removed session for user {user_id}")
     
-    async def cleanup_inactive_sessions(self, max_inactive_hours: int = 24):
+    async def cleanup_inactive_sessions(self, max_inactive_hours: int = SESSION_INACTIVE_HOURS):
         """
         Clean up inactive sessions.
         
         Args:
             max_inactive_hours: Maximum hours of inactivity
         """
-        inactive_users = []
-        for user_id, session in self.sessions.items():
-            if not session.is_active(max_inactive_hours):
-                inactive_users.append(user_id)
+        # One comprehension against a precomputed cutoff instead of an
+        # is_active() call (and clock read) per session
+        cutoff = time.monotonic() - max_inactive_hours * 3600
+        inactive_users = [
+            user_id for user_id, session in self.sessions.items()
+            if session.last_activity_mono <= cutoff
+        ]
         
         for user_id in inactive_users:
             await self.remove_session(user_id)
@@ -283,7 +328,8 @@ class TelegramSessionManager:
     
     def get_active_session_count(self) -> int:
         """Get the number of active sessions."""
-        return len([s for s in self.sessions.values() if s.is_active()])
+        cutoff = time.monotonic() - SESSION_INACTIVE_HOURS * 3600
+        return sum(1 for s in self.sessions.values() if s.last_activity_mono > cutoff)
     
     def get_total_session_count(self) -> int:
         """Get the total number of sessions."""
@@ -2,11 +2,16 @@
 User management for the Telegram bot.
 """
 
+import asyncio
+import functools
+import heapq
 import logging
 import hashlib
-import secrets
-from typing import Dict, Any, Optional, List
-from datetime import datetime, timedelta
+import time
+from collections import ChainMap, OrderedDict
+from base64 import urlsafe_b64encode as _b64e
+from secrets import token_bytes as _token_bytes
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass, asdict
 
 from ..database.operations import InstagramOperations
@@ -14,7 +19,48 @@ from ..database.operations import InstagramOperations
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+def _error_wrap(log_message: str, error_prefix: Optional[str] = None,
+                fallback: Optional[Callable[[], Any]] = None):
+    """
+    Log and convert exceptions raised by a UserManager method.
+    
+    Args:
+        log_message: Log prefix, formatted with the method's arguments by name
+        error_prefix: Prefix of the returned {"error": ...} message
+        fallback: Factory for the value returned instead of an error dict
+    """
+    def decorator(func):
+        param_names = func.__code__.co_varnames[1:func.__code__.co_argcount]
+        
+        def handle(e, args, kwargs):
+            call_args = dict(zip(param_names, args), **kwargs)
+            logger.error("%s: %s", log_message.format_map(call_args), e)
+            if fallback is not None:
+                return fallback()
+            if error_prefix is not None:
+                return {"error": f"{error_prefix}: {str(e)}"}
+            return {"error": str(e)}
+        
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                try:
+                    return await func(self, *args, **kwargs)
+                except Exception as e:
+                    return handle(e, args, kwargs)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return func(self, *args, **kwargs)
+            except Exception as e:
+                return handle(e, args, kwargs)
+        return wrapper
+    return decorator
+
+
+@dataclass(frozen=True, slots=True)
 class UserPreferences:
     """User preferences and settings."""
     language: str = "en"
@@ -27,7 +73,7 @@ class UserPreferences:
     search_history_enabled: bool = True
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class UserPermissions:
     """User permissions and access levels."""
     can_send_messages: bool = True
@@ -39,15 +85,144 @@ class UserPermissions:
     can_export_data: bool = False
 
 
+# Shared by every user until they change a setting (updates build new instances)
+_DEFAULT_PREFERENCES = UserPreferences()
+_DEFAULT_PERMISSIONS = UserPermissions()
+
+_PREF_KEYS = frozenset(UserPreferences.__dataclass_fields__)
+_PERM_KEYS = frozenset(UserPermissions.__dataclass_fields__)
+
+
+def _compile_updater(cls):
+    """
+    Build a function returning a copy of a settings object with changes applied.
+    
+    The generated body passes every field straight to the constructor, which
+    avoids the per-call field walk of dataclasses.replace.
+    
+    Args:
+        cls: Settings dataclass (all fields must be init fields)
+        
+    Returns:
+        Function taking (settings, changes) and returning a new instance
+    """
+    args = ", ".join(f"changes.get({name!r}, settings.{name})" for name in cls.__dataclass_fields__)
+    namespace: Dict[str, Any] = {}
+    exec(f"def update(settings, changes):\n    return cls({args})\n", {"cls": cls}, namespace)
+    return namespace["update"]
+
+
+_update_preferences = _compile_updater(UserPreferences)
+_update_permissions = _compile_updater(UserPermissions)
+
+# Number of user and token shards, must be a power of two
+_SHARD_COUNT = 16
+
+
+@dataclass(slots=True)
+class UserAccount:
+    """Registered user state kept by the user manager (times are int epoch seconds)."""
+    telegram_user_id: int
+    username: str
+    full_name: str
+    registered_at: int
+    last_login: int
+    last_activity: int
+    preferences: UserPreferences = _DEFAULT_PREFERENCES
+    permissions: UserPermissions = _DEFAULT_PERMISSIONS
+    is_active: bool = True
+    login_count: int = 1
+    deactivated_at: Optional[int] = None
+    reactivated_at: Optional[int] = None
+    
+    def summary(self) -> Dict[str, Any]:
+        """Public account fields, without settings."""
+        return {
+            "telegram_user_id": self.telegram_user_id,
+            "username": self.username,
+            "full_name": self.full_name,
+            "registered_at": self.registered_at,
+            "last_login": self.last_login,
+            "last_activity": self.last_activity,
+            "is_active": self.is_active,
+            "login_count": self.login_count,
+            "deactivated_at": self.deactivated_at,
+            "reactivated_at": self.reactivated_at
+        }
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to a plain dict for returning to callers."""
+        user_info = self.summary()
+        user_info["preferences"] = asdict(self.preferences)
+        user_info["permissions"] = asdict(self.permissions)
+        return user_info
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UserAccount":
+        """Rebuild an account from a to_dict() result."""
+        data = {key: value for key, value in data.items() if key in cls.__dataclass_fields__}
+        data["preferences"] = UserPreferences(**data.get("preferences", {}))
+        data["permissions"] = UserPermissions(**data.get("permissions", {}))
+        return cls(**data)
+
+
 class UserManager:
     """Manages user registration, authentication, and permissions."""
     
     def __init__(self):
         """Initialize the user manager."""
         self.db_ops = InstagramOperations()
-        self.user_sessions: Dict[int, Dict[str, Any]] = {}
-        self.auth_tokens: Dict[str, Dict[str, Any]] = {}
+        # Users are partitioned by ID and tokens by hash so writers to
+        # different shards never touch the same dict. User shards are kept in
+        # LRU order and bounded so memory doesn't grow with every user seen.
+        self._shards: List["OrderedDict[int, UserAccount]"] = [OrderedDict() for _ in range(_SHARD_COUNT)]
+        self._max_users = 100_000
+        self._token_shards: List[Dict[str, Dict[str, Any]]] = [{} for _ in range(_SHARD_COUNT)]
+        # Min-heap of (expires_at, token) and per-user token index, so expiry
+        # and revocation only touch the affected tokens
+        self._token_expiry_heap: List[Tuple[int, str]] = []
+        self._user_tokens: Dict[int, Set[str]] = {}
+        self._revoked_in_heap = 0  # Heap entries whose token was revoked early
+        # Expired tokens are swept at most once per interval, not on every login
+        self._last_cleanup = time.monotonic()
+        self._cleanup_interval = 60.0
+        # Running aggregates so get_user_statistics doesn't walk every user
+        self._active_count = 0
+        self._sum_registered_ts = 0
+        # Min-heap of (last_activity, user_id) pushed on deactivation; entries
+        # whose user has since been touched or reactivated are skipped lazily
+        self._inactive_queue: List[Tuple[int, int]] = []
+        # Users currently holding can_access_admin
+        self._admin_uids: Set[int] = set()
+        # The shards are an L1 cache over the bot_users collection. Changes
+        # are recorded here (None marks a deletion) and written behind in
+        # batches by the flush task, so commands never wait on the database.
+        self._dirty: Dict[int, Optional[UserAccount]] = {}
+        # Users registered by this process and not inserted yet. They are
+        # written insert-only, so they can never overwrite a stored user
+        self._new_users: Set[int] = set()
+        self._flush_interval = 5.0
+        self._flush_task: Optional[asyncio.Task] = None
         
+    @property
+    def user_sessions(self) -> ChainMap:
+        """Read-only view of all users across shards."""
+        return ChainMap(*self._shards)
+    
+    @property
+    def auth_tokens(self) -> ChainMap:
+        """Read-only view of all auth tokens across shards."""
+        return ChainMap(*self._token_shards)
+    
+    def _shard(self, telegram_user_id: int) -> "OrderedDict[int, UserAccount]":
+        """Get the shard holding a user."""
+        return self._shards[telegram_user_id & (_SHARD_COUNT - 1)]
+    
+    def _token_shard(self, token: str) -> Dict[str, Dict[str, Any]]:
+        """Get the shard holding an auth token."""
+        return self._token_shards[hash(token) & (_SHARD_COUNT - 1)]
+    
+    @_error_wrap("Error registering user {telegram_user_id}", "Registration failed")
     async def register_user(self, telegram_user_id: int, username: str, full_name: str) -> Dict[str, Any]:
         """
         Register a new user.
@@ -60,49 +235,43 @@ class UserManager:
         Returns:
             Dict containing registration result
         """
-        try:
-            # Check if user already exists
-            if telegram_user_id in self.user_sessions:
-                return {"error": "User already registered"}
-            
-            # Create user session
-            user_session = {
-                "telegram_user_id": telegram_user_id,
-                "username": username,
-                "full_name": full_name,
-                "registered_at": datetime.now(),
-                "last_login": datetime.now(),
-                "is_active": True,
-                "preferences": asdict(UserPreferences()),
-                "permissions": asdict(UserPermissions()),
-                "login_count": 1,
-                "last_activity": datetime.now()
-            }
-            
-            # Store user session
-            self.user_sessions[telegram_user_id] = user_session
-            
-            # Generate authentication token
-            auth_token = self._generate_auth_token()
-            self.auth_tokens[auth_token] = {
-                "telegram_user_id": telegram_user_id,
-                "created_at": datetime.now(),
-                "expires_at": datetime.now() + timedelta(days=30)
-            }
-            
-            logger.info(f"Registered new user: {username} (ID: {telegram_user_id})")
-            
-            return {
-                "success": True,
-                "user_id": telegram_user_id,
-                "auth_token": auth_token,
-                "message": "User registered successfully"
-            }
-            
-        except Exception as e:
-            logger.error(f"Error registering user {telegram_user_id}: {e}")
-            return {"error": f"Registration failed: {str(e)}"}
+        # Check if user already exists, in memory or in the database
+        if await self._get_user(telegram_user_id) is not None:
+            return {"error": "User already registered"}
+        
+        now = int(time.time())
+        
+        # Create user session
+        user_session = UserAccount(
+            telegram_user_id=telegram_user_id,
+            username=username,
+            full_name=full_name,
+            registered_at=now,
+            last_login=now,
+            last_activity=now
+        )
+        
+        # Store user session, evicting the least recently used if full
+        # Re-registering over a pending deletion replaces the stored user;
+        # otherwise the user is only inserted if still absent from the database
+        if telegram_user_id not in self._dirty:
+            self._new_users.add(telegram_user_id)
+        self._insert_user(user_session)
+        self._dirty[telegram_user_id] = user_session
+        
+        # Generate authentication token
+        auth_token = self._issue_auth_token(telegram_user_id, now)
+        
+        logger.info("Registered new user: %s (ID: %s)", username, telegram_user_id)
+        
+        return {
+            "success": True,
+            "user_id": telegram_user_id,
+            "auth_token": auth_token,
+            "message": "User registered successfully"
+        }
     
+    @_error_wrap("Error authenticating user {telegram_user_id}", "Authentication failed")
     async def authenticate_user(self, telegram_user_id: int) -> Dict[str, Any]:
         """
         Authenticate a user.
@@ -113,50 +282,42 @@ class UserManager:
         Returns:
             Dict containing authentication result
         """
-        try:
-            # Check if user exists
-            if telegram_user_id not in self.user_sessions:
-                return {"error": "User not registered"}
-            
-            user_session = self.user_sessions[telegram_user_id]
-            
-            # Check if user is active
-            if not user_session["is_active"]:
-                return {"error": "User account is deactivated"}
-            
-            # Update login information
-            user_session["last_login"] = datetime.now()
-            user_session["login_count"] += 1
-            user_session["last_activity"] = datetime.now()
-            
-            # Generate new auth token
-            auth_token = self._generate_auth_token()
-            self.auth_tokens[auth_token] = {
-                "telegram_user_id": telegram_user_id,
-                "created_at": datetime.now(),
-                "expires_at": datetime.now() + timedelta(days=30)
-            }
-            
-            # Clean up old tokens
+        # Check if user exists
+        user_session = await self._get_user(telegram_user_id)
+        if user_session is None:
+            return {"error": "User not registered"}
+        
+        # Check if user is active
+        if not user_session.is_active:
+            return {"error": "User account is deactivated"}
+        
+        # Update login information
+        now = int(time.time())
+        user_session.last_login = now
+        user_session.login_count += 1
+        user_session.last_activity = now
+        self._dirty[telegram_user_id] = user_session
+        
+        # Generate new auth token
+        auth_token = self._issue_auth_token(telegram_user_id, now)
+        
+        # Clean up old tokens if a sweep hasn't run recently
+        if time.monotonic() - self._last_cleanup > self._cleanup_interval:
             self._cleanup_expired_tokens()
-            
-            logger.info(f"User {telegram_user_id} authenticated successfully")
-            
-            return {
-                "success": True,
-                "user_id": telegram_user_id,
-                "auth_token": auth_token,
-                "preferences": user_session["preferences"],
-                "permissions": user_session["permissions"]
-            }
-            
-        except Exception as e:
-            logger.error(f"Error authenticating user {telegram_user_id}: {e}")
-            return {"error": f"Authentication failed: {str(e)}"}
+        
+        logger.info("User %s authenticated successfully", telegram_user_id)
+        
+        return {
+            "success": True,
+            "user_id": telegram_user_id,
+            "auth_token": auth_token,
+            "preferences": asdict(user_session.preferences),
+            "permissions": asdict(user_session.permissions)
+        }
     
     async def get_user_info(self, telegram_user_id: int) -> Optional[Dict[str, Any]]:
         """
-        Get user information.
+        Get user information, loading the user from the database if needed.
         
         Args:
             telegram_user_id: Telegram user ID
@@ -164,13 +325,10 @@ class UserManager:
         Returns:
             Dict containing user info or None
         """
-        if telegram_user_id in self.user_sessions:
-            user_info = self.user_sessions[telegram_user_id].copy()
-            # Remove sensitive data
-            user_info.pop("auth_token", None)
-            return user_info
-        return None
+        user_session = await self._get_user(telegram_user_id)
+        return user_session.to_dict() if user_session is not None else None
     
+    @_error_wrap("Error updating preferences for user {telegram_user_id}", "Failed to update preferences")
     async def update_user_preferences(self, telegram_user_id: int, preferences: Dict[str, Any]) -> Dict[str, Any]:
         """
         Update user preferences.
@@ -182,31 +340,29 @@ class UserManager:
         Returns:
             Dict containing update result
         """
-        try:
-            if telegram_user_id not in self.user_sessions:
-                return {"error": "User not found"}
-            
-            user_session = self.user_sessions[telegram_user_id]
-            
-            # Update preferences
-            for key, value in preferences.items():
-                if hasattr(UserPreferences, key):
-                    user_session["preferences"][key] = value
-            
-            user_session["last_activity"] = datetime.now()
-            
-            logger.info(f"Updated preferences for user {telegram_user_id}")
-            
-            return {
-                "success": True,
-                "message": "Preferences updated successfully",
-                "preferences": user_session["preferences"]
-            }
-            
-        except Exception as e:
-            logger.error(f"Error updating preferences for user {telegram_user_id}: {e}")
-            return {"error": f"Failed to update preferences: {str(e)}"}
+        user_session = await self._get_user(telegram_user_id)
+        if user_session is None:
+            return {"error": "User not found"}
+        
+        unknown_keys = preferences.keys() - _PREF_KEYS
+        if unknown_keys:
+            return {"error": f"Unknown preferences: {', '.join(sorted(unknown_keys))}"}
+        
+        # Update preferences
+        user_session.preferences = _update_preferences(user_session.preferences, preferences)
+        
+        user_session.last_activity = int(time.time())
+        self._dirty[telegram_user_id] = user_session
+        
+        logger.info("Updated preferences for user %s", telegram_user_id)
+        
+        return {
+            "success": True,
+            "message": "Preferences updated successfully",
+            "preferences": asdict(user_session.preferences)
+        }
     
+    @_error_wrap("Error updating permissions for user {telegram_user_id}", "Failed to update permissions")
     async def update_user_permissions(self, telegram_user_id: int, permissions: Dict[str, Any]) -> Dict[str, Any]:
         """
         Update user permissions (admin only).
@@ -218,35 +374,37 @@ class UserManager:
         Returns:
             Dict containing update result
         """
-        try:
-            if telegram_user_id not in self.user_sessions:
-                return {"error": "User not found"}
-            
-            user_session = self.user_sessions[telegram_user_id]
-            
-            # Check if user has admin permissions
-            if not user_session["permissions"]["can_access_admin"]:
-                return {"error": "Insufficient permissions"}
-            
-            # Update permissions
-            for key, value in permissions.items():
-                if hasattr(UserPermissions, key):
-                    user_session["permissions"][key] = value
-            
-            user_session["last_activity"] = datetime.now()
-            
-            logger.info(f"Updated permissions for user {telegram_user_id}")
-            
-            return {
-                "success": True,
-                "message": "Permissions updated successfully",
-                "permissions": user_session["permissions"]
-            }
-            
-        except Exception as e:
-            logger.error(f"Error updating permissions for user {telegram_user_id}: {e}")
-            return {"error": f"Failed to update permissions: {str(e)}"}
+        user_session = await self._get_user(telegram_user_id)
+        if user_session is None:
+            return {"error": "User not found"}
+        
+        # Check if user has admin permissions
+        if telegram_user_id not in self._admin_uids:
+            return {"error": "Insufficient permissions"}
+        
+        unknown_keys = permissions.keys() - _PERM_KEYS
+        if unknown_keys:
+            return {"error": f"Unknown permissions: {', '.join(sorted(unknown_keys))}"}
+        
+        # Update permissions
+        user_session.permissions = _update_permissions(user_session.permissions, permissions)
+        if user_session.permissions.can_access_admin:
+            self._admin_uids.add(telegram_user_id)
+        else:
+            self._admin_uids.discard(telegram_user_id)
+        
+        user_session.last_activity = int(time.time())
+        self._dirty[telegram_user_id] = user_session
+        
+        logger.info("Updated permissions for user %s", telegram_user_id)
+        
+        return {
+            "success": True,
+            "message": "Permissions updated successfully",
+            "permissions": asdict(user_session.permissions)
+        }
     
+    @_error_wrap("Error deactivating user {telegram_user_id}", "Failed to deactivate user")
     async def deactivate_user(self, telegram_user_id: int) -> Dict[str, Any]:
         """
         Deactivate a user account.
@@ -257,29 +415,31 @@ class UserManager:
         Returns:
             Dict containing deactivation result
         """
-        try:
-            if telegram_user_id not in self.user_sessions:
-                return {"error": "User not found"}
-            
-            user_session = self.user_sessions[telegram_user_id]
-            user_session["is_active"] = False
-            user_session["deactivated_at"] = datetime.now()
-            user_session["last_activity"] = datetime.now()
-            
-            # Remove auth tokens
-            self._remove_user_tokens(telegram_user_id)
-            
-            logger.info(f"Deactivated user {telegram_user_id}")
-            
-            return {
-                "success": True,
-                "message": "User deactivated successfully"
-            }
-            
-        except Exception as e:
-            logger.error(f"Error deactivating user {telegram_user_id}: {e}")
-            return {"error": f"Failed to deactivate user: {str(e)}"}
+        user_session = await self._get_user(telegram_user_id)
+        if user_session is None:
+            return {"error": "User not found"}
+        
+        if user_session.is_active:
+            self._active_count -= 1
+        
+        now = int(time.time())
+        user_session.is_active = False
+        user_session.deactivated_at = now
+        user_session.last_activity = now
+        heapq.heappush(self._inactive_queue, (now, telegram_user_id))
+        
+        # Remove auth tokens
+        self._remove_user_tokens(telegram_user_id)
+        self._dirty[telegram_user_id] = user_session
+        
+        logger.info("Deactivated user %s", telegram_user_id)
+        
+        return {
+            "success": True,
+            "message": "User deactivated successfully"
+        }
     
+    @_error_wrap("Error reactivating user {telegram_user_id}", "Failed to reactivate user")
     async def reactivate_user(self, telegram_user_id: int) -> Dict[str, Any]:
         """
         Reactivate a deactivated user account.
@@ -290,26 +450,27 @@ class UserManager:
         Returns:
             Dict containing reactivation result
         """
-        try:
-            if telegram_user_id not in self.user_sessions:
-                return {"error": "User not found"}
-            
-            user_session = self.user_sessions[telegram_user_id]
-            user_session["is_active"] = True
-            user_session["reactivated_at"] = datetime.now()
-            user_session["last_activity"] = datetime.now()
-            
-            logger.info(f"Reactivated user {telegram_user_id}")
-            
-            return {
-                "success": True,
-                "message": "User reactivated successfully"
-            }
-            
-        except Exception as e:
-            logger.error(f"Error reactivating user {telegram_user_id}: {e}")
-            return {"error": f"Failed to reactivate user: {str(e)}"}
+        user_session = await self._get_user(telegram_user_id)
+        if user_session is None:
+            return {"error": "User not found"}
+        
+        if not user_session.is_active:
+            self._active_count += 1
+        
+        now = int(time.time())
+        user_session.is_active = True
+        user_session.reactivated_at = now
+        user_session.last_activity = now
+        self._dirty[telegram_user_id] = user_session
+        
+        logger.info("Reactivated user %s", telegram_user_id)
+        
+        return {
+            "success": True,
+            "message": "User reactivated successfully"
+        }
     
+    @_error_wrap("Error getting activity for user {telegram_user_id}", "Failed to get activity")
     async def get_user_activity(self, telegram_user_id: int, days: int = 30) -> Dict[str, Any]:
         """
         Get user activity statistics.
@@ -321,59 +482,50 @@ class UserManager:
         Returns:
             Dict containing activity statistics
         """
-        try:
-            if telegram_user_id not in self.user_sessions:
-                return {"error": "User not found"}
-            
-            user_session = self.user_sessions[telegram_user_id]
-            
-            # Calculate activity metrics
-            registered_days = (datetime.now() - user_session["registered_at"]).days
-            last_activity_days = (datetime.now() - user_session["last_activity"]).days
-            
-            activity_stats = {
-                "user_id": telegram_user_id,
-                "username": user_session["username"],
-                "registered_days_ago": registered_days,
-                "last_activity_days_ago": last_activity_days,
-                "total_logins": user_session["login_count"],
-                "is_active": user_session["is_active"],
-                "preferences": user_session["preferences"],
-                "permissions": user_session["permissions"]
-            }
-            
-            return activity_stats
-            
-        except Exception as e:
-            logger.error(f"Error getting activity for user {telegram_user_id}: {e}")
-            return {"error": f"Failed to get activity: {str(e)}"}
+        user_session = await self._get_user(telegram_user_id)
+        if user_session is None:
+            return {"error": "User not found"}
+        
+        # Calculate activity metrics
+        now = int(time.time())
+        registered_days = (now - user_session.registered_at) // 86400
+        last_activity_days = (now - user_session.last_activity) // 86400
+        
+        activity_stats = {
+            "user_id": telegram_user_id,
+            "username": user_session.username,
+            "registered_days_ago": registered_days,
+            "last_activity_days_ago": last_activity_days,
+            "total_logins": user_session.login_count,
+            "is_active": user_session.is_active,
+            "preferences": asdict(user_session.preferences),
+            "permissions": asdict(user_session.permissions)
+        }
+        
+        return activity_stats
     
-    async def get_all_users(self, include_inactive: bool = False) -> List[Dict[str, Any]]:
+    @_error_wrap("Error getting all users", fallback=list)
+    def get_all_users(self, include_inactive: bool = False) -> List[Dict[str, Any]]:
         """
         Get all users (admin only).
         
+        Only users currently held in memory are listed.
+        
         Args:
             include_inactive: Whether to include inactive users
             
         Returns:
-            List of user information
+            List of user information (without preferences and permissions)
         """
-        try:
-            users = []
-            for user_id, user_session in self.user_sessions.items():
-                if include_inactive or user_session["is_active"]:
-                    user_info = user_session.copy()
-                    # Remove sensitive data
-                    user_info.pop("auth_token", None)
-                    users.append(user_info)
-            
-            return users
-            
-        except Exception as e:
-            logger.error(f"Error getting all users: {e}")
-            return []
+        return [
+            user_session.summary()
+            for shard in self._shards
+            for user_session in shard.values()
+            if include_inactive or user_session.is_active
+        ]
     
-    async def cleanup_inactive_users(self, max_inactive_days: int = 90) -> int:
+    @_error_wrap("Error cleaning up inactive users", fallback=int)
+    def cleanup_inactive_users(self, max_inactive_days: int = 90) -> int:
         """
         Clean up inactive users.
         
@@ -383,59 +535,281 @@ class UserManager:
         Returns:
             int: Number of users cleaned up
         """
-        try:
-            current_time = datetime.now()
-            inactive_users = []
-            
-            for user_id, user_session in self.user_sessions.items():
-                if not user_session["is_active"]:
-                    last_activity = user_session["last_activity"]
-                    inactive_days = (current_time - last_activity).days
-                    
-                    if inactive_days > max_inactive_days:
-                        inactive_users.append(user_id)
-            
-            # Remove inactive users
-            for user_id in inactive_users:
-                del self.user_sessions[user_id]
-                self._remove_user_tokens(user_id)
+        # Users idle for more than max_inactive_days whole days
+        cutoff = int(time.time()) - (max_inactive_days + 1) * 86400
+        queue = self._inactive_queue
+        removed_count = 0
+        
+        while queue and queue[0][0] <= cutoff:
+            last_activity, user_id = heapq.heappop(queue)
+            user_session = self._shard(user_id).get(user_id)
+            if user_session is None or user_session.is_active:
+                continue
+            
+            if user_session.last_activity > cutoff:
+                # Touched since this entry was queued, check again later
+                heapq.heappush(queue, (user_session.last_activity, user_id))
+                continue
+            
+            del self._shard(user_id)[user_id]
+            self._admin_uids.discard(user_id)
+            self._dirty[user_id] = None
+            self._new_users.discard(user_id)
+            self._sum_registered_ts -= user_session.registered_at
+            self._remove_user_tokens(user_id)
+            removed_count += 1
+        
+        logger.info("Cleaned up %d inactive users", removed_count)
+        return removed_count
+    
+    def _insert_user(self, user_session: UserAccount):
+        """Add a user to its shard and the running counters, evicting if full."""
+        shard = self._shard(user_session.telegram_user_id)
+        shard[user_session.telegram_user_id] = user_session
+        if user_session.is_active:
+            self._active_count += 1
+        if user_session.permissions.can_access_admin:
+            self._admin_uids.add(user_session.telegram_user_id)
+        self._sum_registered_ts += user_session.registered_at
+        if len(shard) > max(1, self._max_users // _SHARD_COUNT):
+            self._evict_lru(shard)
+    
+    def _evict_lru(self, shard: "OrderedDict[int, UserAccount]"):
+        """
+        Drop the least recently used user of a shard.
+        
+        Their auth tokens stay valid; tokens expire or are revoked on their
+        own, and the user is loaded again on their next request.
+        """
+        user_id, user_session = shard.popitem(last=False)
+        self._forget_user(user_session)
+        logger.info("Evicted least recently used user %s", user_id)
+    
+    def _forget_user(self, user_session: UserAccount):
+        """Take a user removed from its shard out of the running counters."""
+        if user_session.is_active:
+            self._active_count -= 1
+        self._admin_uids.discard(user_session.telegram_user_id)
+        self._sum_registered_ts -= user_session.registered_at
+    
+    async def _get_user(self, telegram_user_id: int) -> Optional[UserAccount]:
+        """
+        Get a user, loading them from the database on an L1 miss.
+        
+        Users evicted from memory or registered by an earlier process are
+        read back from the bot_users collection, so they are never mistaken
+        for new users.
+        
+        Args:
+            telegram_user_id: Telegram user ID
             
-            logger.info(f"Cleaned up {len(inactive_users)} inactive users")
-            return len(inactive_users)
+        Returns:
+            UserAccount or None if the user does not exist
+        """
+        shard = self._shard(telegram_user_id)
+        user_session = shard.get(telegram_user_id)
+        if user_session is not None:
+            shard.move_to_end(telegram_user_id)
+            return user_session
+        
+        if telegram_user_id in self._dirty:
+            # Evicted or deleted before its last change was written back
+            user_session = self._dirty[telegram_user_id]
+        else:
+            data = await self.db_ops.get_bot_user(telegram_user_id)
+            user_session = UserAccount.from_dict(data) if data else None
+        
+        # Re-check, the user may have been loaded or registered while we were waiting
+        if telegram_user_id in shard:
+            return shard[telegram_user_id]
+        if user_session is None:
+            return None
+        
+        self._insert_user(user_session)
+        if not user_session.is_active:
+            heapq.heappush(self._inactive_queue, (user_session.last_activity, telegram_user_id))
+        return user_session
+    
+    async def load_user(self, telegram_user_id: int) -> bool:
+        """
+        Make sure a user is in memory, loading them from the database on a miss.
+        
+        Args:
+            telegram_user_id: Telegram user ID
             
+        Returns:
+            bool: True if the user exists
+        """
+        return await self._get_user(telegram_user_id) is not None
+    
+    async def flush(self) -> int:
+        """
+        Write pending user changes to the database.
+        
+        Returns:
+            int: Number of users written or deleted
+        """
+        if not self._dirty:
+            return 0
+        
+        pending, self._dirty = self._dirty, {}
+        # Users loaded from the database are replaced, users registered here
+        # are only inserted so a stale L1 record never overwrites a stored one
+        upserts = [
+            user.to_dict() for user_id, user in pending.items()
+            if user is not None and user_id not in self._new_users
+        ]
+        inserts = [
+            user.to_dict() for user_id, user in pending.items()
+            if user is not None and user_id in self._new_users
+        ]
+        deletes = [user_id for user_id, user in pending.items() if user is None]
+        
+        try:
+            written = await self.db_ops.bulk_upsert_bot_users(upserts)
+            if written < len(upserts):
+                raise RuntimeError(f"only {written} of {len(upserts)} users written")
+            inserted = await self.db_ops.bulk_insert_bot_users(inserts)
+            if inserted is None:
+                raise RuntimeError(f"{len(inserts)} new users not written")
+            self._reconcile_inserts(pending, inserted)
+            written += len(inserted)
+            deleted = await self.db_ops.delete_bot_users(deletes)
+            if deleted < len(deletes):
+                # delete_bot_users reports errors as a short count; users that
+                # were never written count short too, so only retry the ones
+                # still stored (all of them if that can't be checked)
+                remaining = await self.db_ops.find_bot_user_ids(deletes)
+                if remaining is None:
+                    remaining = deletes
+                if remaining:
+                    logger.error("Error flushing users: %d of %d deletes failed", len(remaining), len(deletes))
+                    for user_id in remaining:
+                        self._dirty.setdefault(user_id, None)
+            return written + deleted
         except Exception as e:
-            logger.error(f"Error cleaning up inactive users: {e}")
+            logger.error("Error flushing %d users: %s", len(pending), e)
+            # Keep changes made while flushing, retry the rest next time
+            for user_id, user in pending.items():
+                self._dirty.setdefault(user_id, user)
             return 0
     
+    def _reconcile_inserts(self, pending: Dict[int, Optional[UserAccount]], inserted: List[int]):
+        """
+        Settle new users after their insert-only write.
+        
+        A new user that was not inserted already existed in the database
+        (registered by another process); the stored record wins and the
+        in-memory one is dropped, to be loaded again on next access.
+        
+        Args:
+            pending: Changes that were flushed
+            inserted: IDs of the new users actually inserted
+        """
+        inserted_ids = set(inserted)
+        for user_id, user in pending.items():
+            if user is None or user_id not in self._new_users:
+                continue
+            self._new_users.discard(user_id)
+            if user_id in inserted_ids:
+                continue
+            
+            logger.warning("User %s already exists in the database, discarding the local registration", user_id)
+            if self._dirty.get(user_id) is user:
+                del self._dirty[user_id]
+            shard = self._shard(user_id)
+            if shard.get(user_id) is user:
+                del shard[user_id]
+                self._forget_user(user)
+    
+    async def start_write_behind(self):
+        """Start the background task flushing user changes to the database."""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_worker())
+    
+    async def stop_write_behind(self):
+        """Stop the flush task and write any remaining changes."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+    
+    async def _flush_worker(self):
+        """Flush user changes every _flush_interval seconds."""
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("User flush worker error: %s", e)
+    
     def _generate_auth_token(self) -> str:
         """Generate a secure authentication token."""
-        return secrets.token_urlsafe(32)
+        # Same output as secrets.token_urlsafe(32), without its per-call lookups
+        return _b64e(_token_bytes(32)).rstrip(b'=').decode('ascii')
+    
+    def _issue_auth_token(self, telegram_user_id: int, now: int) -> str:
+        """Create and index a new authentication token for a user."""
+        auth_token = self._generate_auth_token()
+        expires_at = now + 30 * 86400
+        
+        self._token_shard(auth_token)[auth_token] = {
+            "telegram_user_id": telegram_user_id,
+            "created_at": now,
+            "expires_at": expires_at
+        }
+        heapq.heappush(self._token_expiry_heap, (expires_at, auth_token))
+        self._user_tokens.setdefault(telegram_user_id, set()).add(auth_token)
+        return auth_token
     
     def _remove_user_tokens(self, telegram_user_id: int):
         """Remove all auth tokens for a user."""
-        tokens_to_remove = []
-        for token, token_data in self.auth_tokens.items():
-            if token_data["telegram_user_id"] == telegram_user_id:
-                tokens_to_remove.append(token)
+        # Heap entries for these tokens are skipped once they expire
+        for token in self._user_tokens.pop(telegram_user_id, ()):
+            if self._token_shard(token).pop(token, None) is not None:
+                self._revoked_in_heap += 1
         
-        for token in tokens_to_remove:
-            del self.auth_tokens[token]
+        # Once most of the heap is dead entries, rebuild it in one pass rather
+        # than carrying them until their expiry
+        heap = self._token_expiry_heap
+        if self._revoked_in_heap > len(heap) // 2:
+            self._token_expiry_heap = [
+                entry for entry in heap if entry[1] in self._token_shard(entry[1])
+            ]
+            heapq.heapify(self._token_expiry_heap)
+            self._revoked_in_heap = 0
     
     def _cleanup_expired_tokens(self):
         """Remove expired authentication tokens."""
-        current_time = datetime.now()
-        expired_tokens = []
+        current_time = int(time.time())
+        heap = self._token_expiry_heap
+        expired_count = 0
         
-        for token, token_data in self.auth_tokens.items():
-            if token_data["expires_at"] < current_time:
-                expired_tokens.append(token)
+        while heap and heap[0][0] < current_time:
+            token = heapq.heappop(heap)[1]
+            token_data = self._token_shard(token).pop(token, None)
+            if token_data is None:
+                # Already revoked
+                self._revoked_in_heap -= 1
+                continue
+            
+            expired_count += 1
+            user_tokens = self._user_tokens.get(token_data["telegram_user_id"])
+            if user_tokens is not None:
+                user_tokens.discard(token)
+                if not user_tokens:
+                    del self._user_tokens[token_data["telegram_user_id"]]
         
-        for token in expired_tokens:
-            del self.auth_tokens[token]
+        if expired_count:
+            logger.info("Cleaned up %d expired tokens", expired_count)
         
-        if expired_tokens:
-            logger.info(f"Cleaned up {len(expired_tokens)} expired tokens")
+        self._last_cleanup = time.monotonic()
     
+    @_error_wrap("Error getting user statistics")
     def get_user_statistics(self) -> Dict[str, Any]:
         """
         Get user management statistics.
@@ -443,27 +817,20 @@ class UserManager:
         Returns:
             Dict containing user statistics
         """
-        try:
-            total_users = len(self.user_sessions)
-            active_users = sum(1 for user in self.user_sessions.values() if user["is_active"])
-            inactive_users = total_users - active_users
-            
-            # Calculate average user age
-            total_age = 0
-            for user in self.user_sessions.values():
-                age = (datetime.now() - user["registered_at"]).days
-                total_age += age
-            
-            avg_age = total_age / total_users if total_users > 0 else 0
-            
-            return {
-                "total_users": total_users,
-                "active_users": active_users,
-                "inactive_users": inactive_users,
-                "average_user_age_days": avg_age,
-                "total_auth_tokens": len(self.auth_tokens)
-            }
-            
-        except Exception as e:
-            logger.error(f"Error getting user statistics: {e}")
-            return {"error": str(e)} 
\ No newline at end of file
+        total_users = sum(len(shard) for shard in self._shards)
+        active_users = self._active_count
+        inactive_users = total_users - active_users
+        
+        # Average age follows from the mean registration time
+        if total_users > 0:
+            avg_age = (time.time() - self._sum_registered_ts / total_users) / 86400
+        else:
+            avg_age = 0
+        
+        return {
+            "total_users": total_users,
+            "active_users": active_users,
+            "inactive_users": inactive_users,
+            "average_user_age_days": avg_age,
+            "total_auth_tokens": sum(len(shard) for shard in self._token_shards)
+        }
\ No newline at end of file
@@ -7,14 +7,10 @@ This script tests the core components to ensure they're working correctly.
 import asyncio
 import logging
 import sys
-from datetime import datetime, timedelta
-from pathlib import Path
-
-# Add src to path
-sys.path.insert(0, str(Path(__file__).parent / "src"))
+from datetime import datetime, timedelta, timezone
 
 from config.settings import get_settings
-from database.connection import initialize_database, cleanup_database
+from database.connection import initialize_database, cleanup_database, get_pool_stats
 from database.operations import InstagramOperations
 from database.models import InstagramUser, InstagramThread, InstagramMessage
 from instagram.client import InstagramClient
@@ -29,22 +25,26 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Per-test timeouts in seconds; tests not listed get DEFAULT_TIMEOUT
+DEFAULT_TIMEOUT = 30
+TIMEOUTS = {
+    "Instagram DM Saving": 120,
+}
+
 
 async def test_database_connection():
     """Test database connection and basic operations."""
     logger.info("Testing database connection...")
     
     try:
-        # Initialize database
-        await initialize_database()
-        logger.info("✅ Database connection successful")
-        
-        # Test database operations
+        # The connection itself is opened once in main()
         db_ops = InstagramOperations()
         connection_test = await db_ops.test_connection()
         
         if connection_test:
+            logger.info("✅ Database connection successful")
             logger.info("✅ Database operations test successful")
+            logger.info(f"🔌 Connection pool: {get_pool_stats()}")
         else:
             logger.error("❌ Database operations test failed")
             return False
@@ -117,6 +117,9 @@ async def test_instagram_dm_saving():
     logger.info("Testing Instagram DM saving...")
     
     try:
+        # One timestamp for all test payloads and the recent messages window
+        now = datetime.now(timezone.utc)
+        
         # Get settings
         settings = get_settings()
         logger.info(f"📱 Instagram username: {settings.instagram.instagram_username}")
@@ -144,11 +147,13 @@ async def test_instagram_dm_saving():
             logger.error("❌ Instagram authentication failed!")
             
             # Provide specific guidance based on the error
-            logger.info("💡 Troubleshooting tips:")
-            logger.info("1. Try logging into Instagram in your browser first")
-            logger.info("2. Check if your account has 2FA enabled")
-            logger.info("3. Verify your account isn't temporarily locked")
-            logger.info("4. Try using a different IP address (mobile hotspot)")
+            logger.info(
+                "💡 Troubleshooting tips:\n"
+                "  1. Try logging into Instagram in your browser first\n"
+                "  2. Check if your account has 2FA enabled\n"
+                "  3. Verify your account isn't temporarily locked\n"
+                "  4. Try using a different IP address (mobile hotspot)"
+            )
             
             return False
         logger.info("✅ Instagram authentication successful!")
@@ -174,8 +179,8 @@ async def test_instagram_dm_saving():
             "biography": "Test bio",
             "external_url": None,
             "is_business": False,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now()
+            "created_at": now,
+            "updated_at": now
         }
         
         # Test saving a simple thread
@@ -185,8 +190,8 @@ async def test_instagram_dm_saving():
             "participants": ["test_user_123", "test_user_456"],
             "is_group": False,
             "message_count": 5,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now()
+            "created_at": now,
+            "updated_at": now
         }
         
         # Test saving a simple message
@@ -196,37 +201,22 @@ async def test_instagram_dm_saving():
             "sender_id": "test_user_123",
             "message_type": "text",
             "content": "Test message",
-            "created_at": datetime.now(),
-            "updated_at": datetime.now()
+            "created_at": now,
+            "updated_at": now
         }
         
         try:
-            # Test user creation
-            logger.info("👤 Testing user creation...")
-            user = InstagramUser(**test_user_data)
-            user_id = await db_ops.create_user(user)
-            if user_id:
-                logger.info(f"✅ User created with ID: {user_id}")
-            else:
-                logger.warning("⚠️ User creation returned None")
-            
-            # Test thread creation
-            logger.info("🧵 Testing thread creation...")
-            thread = InstagramThread(**test_thread_data)
-            thread_id = await db_ops.create_thread(thread)
-            if thread_id:
-                logger.info(f"✅ Thread created with ID: {thread_id}")
-            else:
-                logger.warning("⚠️ Thread creation returned None")
-            
-            # Test message creation
-            logger.info("📨 Testing message creation...")
-            message = InstagramMessage(**test_message_data)
-            message_id = await db_ops.create_message(message)
-            if message_id:
-                logger.info(f"✅ Message created with ID: {message_id}")
-            else:
-                logger.warning("⚠️ Message creation returned None")
+            # Save user, thread and message with one bulk_write per collection
+            logger.info("📦 Testing batch creation of user, thread and message...")
+            created = await db_ops.create_many(
+                users=[InstagramUser.model_validate(test_user_data)],
+                threads=[InstagramThread.model_validate(test_thread_data)],
+                messages=[InstagramMessage.model_validate(test_message_data)]
+            )
+            logger.info(
+                f"✅ Created {created['users']} users, {created['threads']} threads, "
+                f"{created['messages']} messages (existing documents are skipped)"
+            )
                 
         except Exception as e:
             logger.error(f"❌ Error in direct data saving: {e}")
@@ -252,32 +242,31 @@ async def test_instagram_dm_saving():
         
         if sync_result.get('success'):
             stats = sync_result.get('stats', {})
-            logger.info(f"✅ Sync successful!")
-            logger.info(f"📨 Messages synced: {stats.get('total_messages_synced', 0)}")
-            logger.info(f"🧵 Threads synced: {stats.get('total_threads_synced', 0)}")
-            logger.info(f"👥 Users synced: {stats.get('total_users_synced', 0)}")
-            logger.info(f"⏱️ Duration: {sync_result.get('duration', 0):.2f} seconds")
+            logger.info(
+                "✅ Sync successful!\n  messages=%d\n  threads=%d\n  users=%d\n  duration=%.2fs",
+                stats.get('total_messages_synced', 0),
+                stats.get('total_threads_synced', 0),
+                stats.get('total_users_synced', 0),
+                sync_result.get('duration', 0)
+            )
         else:
             logger.error(f"❌ Sync failed: {sync_result.get('error')}")
             return False
         
         # Check what was saved in the database
-        logger.info("📊 Checking database contents...")
-        
-        # Get message count
-        message_count = await db_ops.get_message_count()
-        logger.info(f"📨 Total messages in database: {message_count}")
-        
-        # Get thread count
-        thread_count = await db_ops.get_thread_count()
-        logger.info(f"🧵 Total threads in database: {thread_count}")
-        
-        # Get recent messages
-        recent_messages = await db_ops.get_messages_since(
-            since=datetime.now() - timedelta(hours=1),
-            limit=5
+        # The counts and the recent messages query are independent
+        message_count, thread_count, recent_count = await asyncio.gather(
+            db_ops.get_message_count(),
+            db_ops.get_thread_count(),
+            db_ops.count_messages_since(
+                since=now - timedelta(hours=1),
+                limit=5
+            )
+        )
+        logger.info(
+            "📊 Database contents:\n  messages=%d\n  threads=%d\n  recent messages (last hour)=%d",
+            message_count, thread_count, recent_count
         )
-        logger.info(f"🕐 Recent messages (last hour): {len(recent_messages)}")
         
         # Cleanup
         await instagram_client.close()
@@ -298,24 +287,23 @@ async def test_configuration():
     try:
         settings = get_settings()
         
-        # Check required settings
+        # Check required settings, which live on the nested settings groups
         required_settings = [
-            'mongodb_uri',
-            'telegram_bot_token',
-            'instagram_username',
-            'instagram_password'
+            (settings.database, 'mongodb_uri'),
+            (settings.telegram, 'bot_token'),
+            (settings.instagram, 'instagram_username'),
+            (settings.instagram, 'instagram_password')
         ]
         
-        missing_settings = []
-        for setting in required_settings:
-            if not hasattr(settings, setting) or not getattr(settings, setting):
-                missing_settings.append(setting)
+        # A missing attribute falls back to None and counts as empty
+        missing_settings = {setting for group, setting in required_settings if not getattr(group, setting, None)}
         
         if missing_settings:
-            logger.warning(f"⚠️  Missing or empty settings: {missing_settings}")
+            logger.warning("⚠️  Missing or empty settings: %s", sorted(missing_settings))
         else:
             logger.info("✅ All required settings are configured")
         
+        logger.info(f"🗂️ Settings cache: {get_settings.cache_info()}")
         logger.info("✅ Configuration test completed")
         return True
         
@@ -328,6 +316,8 @@ async def run_all_tests():
     """Run all tests and report results."""
     logger.info("🚀 Starting functionality tests...")
     
+    # The database is initialized once in main(), so no test mutates shared
+    # state and all of them can overlap their I/O waits
     tests = [
         ("Configuration", test_configuration),
         ("Database Connection", test_database_connection),
@@ -339,17 +329,26 @@ async def run_all_tests():
     
     results = {}
     
-    for test_name, test_func in tests:
-        logger.info(f"\n{'='*50}")
-        logger.info(f"Running test: {test_name}")
-        logger.info(f"{'='*50}")
-        
-        try:
-            result = await test_func()
-            results[test_name] = result
-        except Exception as e:
-            logger.error(f"Test {test_name} crashed: {e}")
-            results[test_name] = False
+    logger.info(f"\n{'='*50}")
+    logger.info(f"Running tests concurrently: {', '.join(name for name, _ in tests)}")
+    logger.info(f"{'='*50}")
+    
+    # A stuck test (e.g. a hanging Instagram login) fails on its own timeout
+    # instead of holding up the whole run
+    raw_results = await asyncio.gather(
+        *(asyncio.wait_for(test_func(), timeout=TIMEOUTS.get(test_name, DEFAULT_TIMEOUT))
+          for test_name, test_func in tests),
+        return_exceptions=True
+    )
+    
+    for (test_name, _), result in zip(tests, raw_results):
+        if isinstance(result, asyncio.TimeoutError):
+            logger.error(f"Test {test_name} timeout after {TIMEOUTS.get(test_name, DEFAULT_TIMEOUT)}s")
+            result = False
+        elif isinstance(result, Exception):
+            logger.error(f"Test {test_name} crashed: {result}")
+            result = False
+        results[test_name] = result
     
     # Report results
     logger.info(f"\n{'='*50}")
@@ -378,6 +377,12 @@ async def run_all_tests():
 async def main():
     """Main test function."""
     try:
+        # Connect once; every test reuses this connection
+        try:
+            await initialize_database()
+        except Exception as e:
+            logger.error(f"❌ Database initialization failed: {e}")
+        
         success = await run_all_tests()
         
         if success:
@@ -403,5 +408,12 @@ async def main():
 
 
 if __name__ == "__main__":
+    try:
+        # Faster event loop when available; asyncio.run picks up its policy
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     exit_code = asyncio.run(main())
     sys.exit(exit_code) 
\ No newline at end of file
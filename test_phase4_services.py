@@ -4,40 +4,146 @@ Test script for Phase 4 services (Real-time Communication).
 Tests message queue, realtime service, and media handler functionality.
 """
 
+import argparse
 import asyncio
+import atexit
+import importlib
+import importlib.util
 import logging
+import logging.handlers
+import queue
 import sys
-from pathlib import Path
-
-# Add src to path
-sys.path.insert(0, str(Path(__file__).parent / "src"))
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Tuple
 
+# Service modules are imported inside the tests that use them, so the
+# script starts (and reports import errors per test) without loading them
 from config.settings import get_settings
-from services.message_queue import MessageQueueService, MessageType, QueueMessage, MessagePriority
-from services.realtime_service import RealtimeService
-from services.media_handler import MediaHandler, MediaType, MediaFormat
 
-# Configure logging
+# Configure logging; records are written to stderr by a background thread
+# so concurrent tests never block on the stream
+_log_queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
 )
 
 logger = logging.getLogger(__name__)
 
+# Separator line between test phases in the log
+LOG_SEP = "=" * 50
+
+# Per-test outcome labels in the results summary
+PASS = "✅ PASS"
+FAIL = "❌ FAIL"
+
+# Startup settings, logged as one record
+SETTINGS_BANNER = "\n".join([
+    "Environment: %s",
+    "Redis URL: %s",
+    "WebSocket: %s:%s",
+    "Media Cache: %s",
+])
+
+# Prefix of the queue keys used by the message queue test, so it never
+# touches the application's queues on a shared Redis
+TEST_QUEUE_PREFIX = "phase4_test:"
+
+# Seconds the concurrent service tests may take before they are cancelled
+CONCURRENT_TIMEOUT = 30
+
+# Maximum number of services initializing at the same time
+SERVICE_INIT_CONCURRENCY = 2
+
+# Default timeout scale in --smoke mode
+SMOKE_TIMEOUT_SCALE = 0.1
+
+# Multiplier for the suite's timeouts, set from the command line
+_timeout_scale = 1.0
+
+# 1x1 red JPEG, enough for the media handler to detect, measure and store
+MIN_JPEG = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300100b0c0e0c0a100e0d0e12"
+    "11101318281a181616183123251d283a333d3c3933383740485c4e404457453738506d51"
+    "575f626768673e4d71797064785c656763ffdb0043011112121815182f1a1a2f63423842"
+    "636363636363636363636363636363636363636363636363636363636363636363636363"
+    "6363636363636363636363636363ffc00011080001000103012200021101031101ffc400"
+    "1500010100000000000000000000000000000005ffc40014100100000000000000000000"
+    "000000000000ffc4001501010100000000000000000000000000000506ffc40014110100"
+    "000000000000000000000000000000ffda000c03010002110311003f008a00b5e3ffd9"
+)
+
+
+def scaled(seconds: float) -> float:
+    """Apply the command-line timeout scale to a timeout in seconds."""
+    return seconds * _timeout_scale
+
+
+async def bounded(aw, timeout: float = 5.0):
+    """
+    Await a service call, failing fast if the service hangs.
+    
+    Args:
+        aw: Awaitable to run
+        timeout: Seconds allowed, before the command-line timeout scale
+    
+    Raises:
+        asyncio.TimeoutError: If the call does not finish in time
+    """
+    return await asyncio.wait_for(aw, scaled(timeout))
+
+
+async def wait_for_message_status(mq_service, message_id, statuses=("completed", "failed"), timeout=2.0):
+    """
+    Poll a queued message's status until it reaches one of the given states.
+    
+    The polling interval starts at 10ms and doubles up to 200ms, so a fast
+    consumer is noticed almost immediately.
+    
+    Returns:
+        The last status seen, which is not in statuses if the timeout expired
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + scaled(timeout)
+    delay = 0.01
+    
+    status = await bounded(mq_service.get_message_status(message_id), 1.0)
+    while status not in statuses and loop.time() < deadline:
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.2)
+        status = await bounded(mq_service.get_message_status(message_id), 1.0)
+    
+    return status
+
 
 async def test_message_queue():
     """Test message queue functionality."""
-    logger.info("Testing Message Queue Service...")
-    
+    mq_service = None
     try:
-        # Get message queue service
-        mq_service = await get_message_queue_service()
+        from services.message_queue import MessageType, QueueMessage, MessagePriority, MessageQueueService
+        
+        # A separate service on test-only queue keys, so the test neither
+        # consumes real messages nor races the realtime service's consumers
+        mq_service = MessageQueueService(
+            redis_url=get_settings().redis_url,
+            key_prefix=TEST_QUEUE_PREFIX
+        )
+        test_queues = list(mq_service.queues.values()) + list(mq_service.priority_queues.values())
+        await bounded(mq_service.initialize())
+        
+        # Start from empty test queues
+        await bounded(mq_service.redis.delete(*test_queues), 2.0)
         
         # Test enqueueing a message
         test_message = QueueMessage(
-            id="test_msg_001",
-            type=MessageType.INSTAGRAM_DM,
+            id=f"test_msg_{uuid.uuid4().hex}",
+            type=MessageType.TELEGRAM_MESSAGE,
             priority=MessagePriority.HIGH,
             payload={
                 "thread_id": "test_thread_123",
@@ -50,54 +156,71 @@ async def test_message_queue():
         )
         
         # Enqueue message
-        success = await mq_service.enqueue_message(test_message)
-        logger.info(f"Message enqueued: {success}")
+        success = await bounded(mq_service.enqueue_message(test_message), 2.0)
         
-        # Test dequeuing
-        dequeued_message = await mq_service.dequeue_message(MessageType.INSTAGRAM_DM, timeout=2)
-        if dequeued_message:
-            logger.info(f"Message dequeued: {dequeued_message.id}")
-            # Mark as completed
-            await mq_service.mark_message_completed(dequeued_message.id)
-            logger.info("Message marked as completed")
-        else:
-            logger.warning("No message dequeued")
+        # Test dequeuing; BRPOP returns as soon as the message is there
+        dequeued_message = await bounded(
+            mq_service.dequeue_message(MessageType.TELEGRAM_MESSAGE, timeout=scaled(0.5)), 2.0
+        )
+        if dequeued_message is None or dequeued_message.id != test_message.id:
+            logger.error("❌ Message Queue Service test failed: enqueued message was not dequeued")
+            return False
         
-        # Get queue stats
-        stats = await mq_service.get_queue_stats()
-        logger.info(f"Queue stats: {stats}")
+        # Mark as completed
+        await bounded(mq_service.mark_message_completed(dequeued_message.id), 2.0)
         
-        # Health check
-        health = await mq_service.health_check()
-        logger.info(f"Health check: {health}")
+        # Queue stats and health check are independent
+        stats, health = await bounded(asyncio.gather(
+            mq_service.get_queue_stats(),
+            mq_service.health_check()
+        ), 2.0)
         
-        logger.info("✅ Message Queue Service test completed successfully")
+        logger.info(
+            "✅ Message Queue Service test completed successfully\n"
+            "  enqueued=%s\n  dequeued=%s\n  stats=%s\n  health=%s",
+            success, dequeued_message.id, stats, health
+        )
         return True
         
+    except asyncio.TimeoutError:
+        logger.error("❌ Message Queue Service test timed out")
+        return False
     except Exception as e:
         logger.error(f"❌ Message Queue Service test failed: {e}")
         return False
+    finally:
+        if mq_service is not None and mq_service.redis is not None:
+            try:
+                await bounded(mq_service.redis.delete(*test_queues), 2.0)
+            except Exception as e:
+                logger.warning(f"Could not remove test queues: {e}")
+            await mq_service.cleanup()
 
 
 async def test_realtime_service():
     """Test realtime service functionality."""
-    logger.info("Testing Real-time Service...")
-    
     try:
-        # Get realtime service
-        rt_service = await get_realtime_service()
+        from services.realtime_service import get_realtime_service
         
-        # Health check
-        health = await rt_service.health_check()
-        logger.info(f"Health check: {health}")
+        # Get realtime service
+        rt_service = await bounded(get_realtime_service())
         
-        # Get connection stats
-        stats = await rt_service.get_connection_stats()
-        logger.info(f"Connection stats: {stats}")
+        # Health check and connection stats are independent
+        health, stats = await bounded(asyncio.gather(
+            rt_service.health_check(),
+            rt_service.get_connection_stats()
+        ), 2.0)
         
-        logger.info("✅ Real-time Service test completed successfully")
+        logger.info(
+            "✅ Real-time Service test completed successfully\n"
+            "  health=%s\n  stats=%s",
+            health, stats
+        )
         return True
         
+    except asyncio.TimeoutError:
+        logger.error("❌ Real-time Service test timed out")
+        return False
     except Exception as e:
         logger.error(f"❌ Real-time Service test failed: {e}")
         return False
@@ -105,56 +228,41 @@ async def test_realtime_service():
 
 async def test_media_handler():
     """Test media handler functionality."""
-    logger.info("Testing Media Handler...")
-    
     try:
-        # Get media handler
-        media_handler = await get_media_handler()
+        from services.media_handler import MediaType, get_media_handler
         
-        # Health check
-        health = await media_handler.health_check()
-        logger.info(f"Health check: {health}")
+        # Get media handler
+        media_handler = await bounded(get_media_handler())
         
-        # Get storage stats
-        stats = await media_handler.get_storage_stats()
-        logger.info(f"Storage stats: {stats}")
+        # Health check and storage stats are independent
+        health, stats = await bounded(asyncio.gather(
+            media_handler.health_check(),
+            media_handler.get_storage_stats()
+        ), 2.0)
         
-        # Test creating a test image file
-        test_image_path = Path("test_image.jpg")
-        if not test_image_path.exists():
-            # Create a simple test image using PIL
-            try:
-                from PIL import Image, ImageDraw
-                img = Image.new('RGB', (100, 100), color='red')
-                draw = ImageDraw.Draw(img)
-                draw.text((10, 40), "TEST", fill='white')
-                img.save(test_image_path)
-                logger.info("Created test image for testing")
-            except ImportError:
-                logger.warning("PIL not available, skipping image creation test")
+        # Test processing the image straight from memory
+        media_info = await bounded(media_handler.process_media_bytes(
+            MIN_JPEG, 
+            "test_image.jpg", 
+            MediaType.IMAGE
+        ), 10.0)
         
-        if test_image_path.exists():
-            # Test processing the image
-            media_info = await media_handler.process_media_file(
-                test_image_path, 
-                "test_image.jpg", 
-                MediaType.IMAGE
-            )
-            
-            if media_info:
-                logger.info(f"Media processed: {media_info.id}")
-                logger.info(f"Media type: {media_info.media_type}")
-                logger.info(f"Format: {media_info.format}")
-                
-                # Clean up test file
-                test_image_path.unlink()
-                logger.info("Test image cleaned up")
-            else:
-                logger.warning("Media processing failed")
+        if not media_info:
+            logger.warning("Media processing failed")
         
-        logger.info("✅ Media Handler test completed successfully")
+        logger.info(
+            "✅ Media Handler test completed successfully\n"
+            "  health=%s\n  stats=%s\n  media=%s (%s, %s)",
+            health, stats,
+            media_info.id if media_info else None,
+            media_info.media_type if media_info else None,
+            media_info.format if media_info else None
+        )
         return True
         
+    except asyncio.TimeoutError:
+        logger.error("❌ Media Handler test timed out")
+        return False
     except Exception as e:
         logger.error(f"❌ Media Handler test failed: {e}")
         return False
@@ -162,13 +270,15 @@ async def test_media_handler():
 
 async def test_integration():
     """Test integration between services."""
-    logger.info("Testing Service Integration...")
-    
     try:
+        from services.message_queue import MessageType, QueueMessage, MessagePriority, get_message_queue_service
+        from services.realtime_service import get_realtime_service
+        from services.media_handler import get_media_handler
+        
         # Test that all services can work together
-        mq_service = await get_message_queue_service()
-        rt_service = await get_realtime_service()
-        media_handler = await get_media_handler()
+        mq_service = await bounded(get_message_queue_service())
+        rt_service = await bounded(get_realtime_service())
+        media_handler = await bounded(get_media_handler())
         
         # Test sending a message through the queue that triggers realtime updates
         test_message = QueueMessage(
@@ -187,70 +297,215 @@ async def test_integration():
         )
         
         # Enqueue the message
-        success = await mq_service.enqueue_message(test_message)
-        logger.info(f"Integration test message enqueued: {success}")
+        success = await bounded(mq_service.enqueue_message(test_message), 2.0)
         
-        # Wait a moment for processing
-        await asyncio.sleep(1)
+        # Wait until the realtime service's notification consumer handles it
+        status = await wait_for_message_status(mq_service, test_message.id)
         
         # Check final stats
-        mq_stats = await mq_service.get_queue_stats()
-        rt_stats = await rt_service.get_connection_stats()
-        media_stats = await media_handler.get_storage_stats()
-        
-        logger.info(f"Final stats - MQ: {mq_stats}, RT: {rt_stats}, Media: {media_stats}")
+        mq_stats, rt_stats, media_stats = await bounded(asyncio.gather(
+            mq_service.get_queue_stats(),
+            rt_service.get_connection_stats(),
+            media_handler.get_storage_stats()
+        ), 2.0)
         
-        logger.info("✅ Service Integration test completed successfully")
+        logger.info(
+            "✅ Service Integration test completed successfully\n"
+            "  enqueued=%s\n  status=%s\n  final stats - MQ: %s, RT: %s, Media: %s",
+            success, status, mq_stats, rt_stats, media_stats
+        )
         return True
         
+    except asyncio.TimeoutError:
+        logger.error("❌ Service Integration test timed out")
+        return False
     except Exception as e:
         logger.error(f"❌ Service Integration test failed: {e}")
         return False
 
 
-async def main():
-    """Main test function."""
+@dataclass(frozen=True, slots=True)
+class TestSpec:
+    """A test in the suite and what it needs to run."""
+    __test__ = False  # Not a pytest test class
+    
+    name: str
+    coro: Callable[[], Awaitable[bool]]
+    requires: Tuple[str, ...] = ()  # Importable modules the test depends on
+    concurrent: bool = True  # Safe to run alongside the other concurrent tests
+    smoke: bool = True  # Part of the quick --smoke run
+    services: Tuple[str, ...] = ()  # Shared services (SERVICE_GETTERS keys) warmed up for it
+
+
+# Module and singleton getter of each shared service
+SERVICE_GETTERS = {
+    "message_queue": ("services.message_queue", "get_message_queue_service"),
+    "realtime": ("services.realtime_service", "get_realtime_service"),
+    "media": ("services.media_handler", "get_media_handler"),
+}
+
+SPECS = (
+    # Uses its own queue service on test-only keys, nothing shared to warm up
+    TestSpec("Message Queue", test_message_queue, requires=("aioredis",)),
+    TestSpec(
+        "Real-time Service", test_realtime_service,
+        requires=("aioredis", "websockets"), services=("realtime",)
+    ),
+    TestSpec("Media Handler", test_media_handler, requires=("PIL", "magic"), services=("media",)),
+    TestSpec(
+        "Service Integration", test_integration,
+        requires=("aioredis", "websockets", "PIL", "magic"), concurrent=False, smoke=False,
+        services=("message_queue", "realtime", "media")
+    ),
+)
+
+
+def _available(module_name: str) -> bool:
+    """Check whether a module can be imported, without importing it."""
+    return importlib.util.find_spec(module_name) is not None
+
+
+async def run_concurrently(specs) -> List[Any]:
+    """
+    Run tests concurrently, all or nothing within CONCURRENT_TIMEOUT.
+    
+    On Python 3.11+ the tests run in a TaskGroup under asyncio.timeout, so a
+    crash or a hang cancels the others right away; older versions fall back
+    to gather under wait_for.
+    
+    Returns:
+        Each test's result, or the exception that ended it
+    """
+    if sys.version_info < (3, 11):
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(*(spec.coro() for spec in specs), return_exceptions=True),
+                timeout=scaled(CONCURRENT_TIMEOUT)
+            )
+        except asyncio.TimeoutError as e:
+            return [e] * len(specs)
+    
+    tasks = []
+    error = None
+    try:
+        async with asyncio.timeout(scaled(CONCURRENT_TIMEOUT)):
+            async with asyncio.TaskGroup() as tg:
+                tasks = [tg.create_task(spec.coro()) for spec in specs]
+    except (ExceptionGroup, TimeoutError) as e:
+        error = e
+    
+    return [
+        task.exception() or task.result() if task.done() and not task.cancelled() else error
+        for task in tasks
+    ]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse the suite's command-line options."""
+    parser = argparse.ArgumentParser(description="Phase 4 services test suite")
+    parser.add_argument(
+        "--smoke", action="store_true",
+        help="run only the quick service tests, with shorter timeouts"
+    )
+    parser.add_argument(
+        "--timeout-scale", type=float, default=None,
+        help=f"multiplier for all timeouts (default 1.0, or {SMOKE_TIMEOUT_SCALE} with --smoke)"
+    )
+    args = parser.parse_args(argv)
+    if args.timeout_scale is None:
+        args.timeout_scale = SMOKE_TIMEOUT_SCALE if args.smoke else 1.0
+    return args
+
+
+async def main(smoke: bool = False, timeout_scale: float = 1.0):
+    """
+    Main test function.
+    
+    Args:
+        smoke: Run only the tests marked for the smoke run
+        timeout_scale: Multiplier for the suite's timeouts
+    """
+    global _timeout_scale
+    _timeout_scale = timeout_scale
+    
     logger.info("🚀 Starting Phase 4 Services Test Suite")
     
     # Get settings
     settings = get_settings()
-    logger.info(f"Environment: {settings.environment}")
-    logger.info(f"Redis URL: {settings.redis_url}")
-    logger.info(f"WebSocket: {settings.websocket_host}:{settings.websocket_port}")
-    logger.info(f"Media Cache: {settings.media_cache_path}")
+    logger.info(
+        SETTINGS_BANNER,
+        settings.environment,
+        settings.redis_url,
+        settings.websocket_host,
+        settings.websocket_port,
+        settings.media_cache_path
+    )
     
-    # Run tests
-    tests = [
-        ("Message Queue", test_message_queue),
-        ("Real-time Service", test_realtime_service),
-        ("Media Handler", test_media_handler),
-        ("Service Integration", test_integration)
-    ]
+    # Skip tests whose third-party dependencies are not installed
+    runnable = []
+    for spec in SPECS:
+        if smoke and not spec.smoke:
+            logger.info(f"Skipping {spec.name} Test in smoke mode")
+            continue
+        missing = [module for module in spec.requires if not _available(module)]
+        if missing:
+            logger.warning(f"Skipping {spec.name} Test, missing: {', '.join(missing)}")
+        else:
+            runnable.append(spec)
+    
+    # Initialize the shared services the selected tests use, once and
+    # concurrently but capped so their Redis/WebSocket connects don't all
+    # land at the same moment; a failure here is reported again by the test
+    # that uses the service
+    init_limit = asyncio.Semaphore(SERVICE_INIT_CONCURRENCY)
+    
+    async def init_service(module_name, getter_name):
+        async with init_limit:
+            module = importlib.import_module(module_name)
+            return await bounded(getattr(module, getter_name)())
+    
+    needed = sorted({service for spec in runnable for service in spec.services})
+    init_results = await asyncio.gather(
+        *(init_service(*SERVICE_GETTERS[service]) for service in needed),
+        return_exceptions=True
+    )
+    for service, result in zip(needed, init_results):
+        if isinstance(result, Exception):
+            logger.error(f"Service initialization failed ({service}): {result!r}")
+    
+    # Independent service tests run concurrently; the rest (integration,
+    # which exercises all services together) run after them, one by one
+    concurrent_specs = [spec for spec in runnable if spec.concurrent]
+    serial_specs = [spec for spec in runnable if not spec.concurrent]
+    
+    logger.info(f"\n{LOG_SEP}\nRunning tests concurrently: {', '.join(spec.name for spec in concurrent_specs)}\n{LOG_SEP}")
+    
+    raw_results = await run_concurrently(concurrent_specs)
     
     results = []
-    for test_name, test_func in tests:
-        logger.info(f"\n{'='*50}")
-        logger.info(f"Running {test_name} Test")
-        logger.info(f"{'='*50}")
+    for spec, result in zip(concurrent_specs, raw_results):
+        if isinstance(result, Exception):
+            logger.error(f"Test {spec.name} crashed: {result}")
+            result = False
+        results.append((spec.name, result))
+    
+    for spec in serial_specs:
+        logger.info(f"\n{LOG_SEP}\nRunning {spec.name} Test\n{LOG_SEP}")
         
         try:
-            result = await test_func()
-            results.append((test_name, result))
+            results.append((spec.name, await spec.coro()))
         except Exception as e:
-            logger.error(f"Test {test_name} crashed: {e}")
-            results.append((test_name, False))
+            logger.error(f"Test {spec.name} crashed: {e}")
+            results.append((spec.name, False))
     
     # Summary
-    logger.info(f"\n{'='*50}")
-    logger.info("TEST RESULTS SUMMARY")
-    logger.info(f"{'='*50}")
+    logger.info(f"\n{LOG_SEP}\nTEST RESULTS SUMMARY\n{LOG_SEP}")
     
     passed = 0
     total = len(results)
     
     for test_name, result in results:
-        status = "✅ PASS" if result else "❌ FAIL"
-        logger.info(f"{test_name}: {status}")
+        logger.info("%s: %s", test_name, PASS if result else FAIL)
         if result:
             passed += 1
     
@@ -266,7 +521,15 @@ async def main():
 
 if __name__ == "__main__":
     try:
-        success = asyncio.run(main())
+        # Faster event loop when available; asyncio.run picks up its policy
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
+    try:
+        args = parse_args()
+        success = asyncio.run(main(smoke=args.smoke, timeout_scale=args.timeout_scale))
         sys.exit(0 if success else 1)
     except KeyboardInterrupt:
         logger.info("Test interrupted by user")